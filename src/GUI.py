@@ -1,19 +1,38 @@
+import queue
+import threading
 import tkinter as tk
 from tkinter import ttk, filedialog
 import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from decision_tree import learn_tree, parse_criterion
-import networkx as nx
+from decision_tree import ProgressStats, TrainingCancelled, TrainingData, learn_tree, parse_criterion
+from forest import flatten_forest
+from model_io import load_flat
+from visualize import NODE_HEIGHT, NODE_WIDTH, LayoutCache, collapsed_below, write_layout
+
+# Input fields and the dataset column each one fills
+ENTRY_FEATURES = {
+    "gender": "Gender",
+    "age": "Age",
+    "sleep_duration": "Sleep_Hours",
+    "physical_activity": "Physical_Activity_Level",
+    "bmi": "BMI",
+    "stress_level": "Stress_Level",
+}
 
 
 class SleepQualityApp:
+    # How often the Tk loop checks on the background worker (ms)
+    POLL_MS = 100
+
     def __init__(self, root):
         self.root = root
         root.title("Sleep Quality Predictor")
 
         self.df = None
-        self.tree = None
+        self.forest = None # the trained tree (or loaded forest) flattened for prediction and drawing
+        self.layouts = None # LayoutCache of self.forest
+        self.progress = None # ProgressStats of the running training
+        self.busy = False # a worker job (loading or training) is pending
+        self.results = queue.Queue() # (kind, value) messages from the worker thread
 
         input_frame = ttk.LabelFrame(root, text="Input Features")
         input_frame.pack(padx=10, pady=5, fill="x")
@@ -36,54 +55,33 @@ class SleepQualityApp:
 
         control_frame = ttk.Frame(root)
         control_frame.pack(pady=5)
-        ttk.Button(control_frame, text="Upload CSV", command=self.upload_csv).pack(side="left", padx=5)
-        ttk.Button(control_frame, text="Train Tree", command=self.train_tree).pack(side="left", padx=5)
+        self.upload_button = ttk.Button(control_frame, text="Upload CSV", command=self.upload_csv)
+        self.upload_button.pack(side="left", padx=5)
+        self.train_button = ttk.Button(control_frame, text="Train Tree", command=self.train_tree)
+        self.train_button.pack(side="left", padx=5)
+        self.cancel_button = ttk.Button(control_frame, text="Cancel", command=self.cancel_training, state="disabled")
+        self.cancel_button.pack(side="left", padx=5)
+        self.load_forest_button = ttk.Button(control_frame, text="Load Forest", command=self.load_forest)
+        self.load_forest_button.pack(side="left", padx=5)
         self.visualize_button = ttk.Button(root, text="Visualize Tree", command=self.visualize_tree)
         self.visualize_button.pack(pady=5)
 
         ttk.Button(control_frame, text="Predict", command=self.predict).pack(side="left", padx=5)
 
+        self.progress_label = ttk.Label(root, text="")
+        self.progress_label.pack()
         self.result_label = ttk.Label(root, text="")
         self.result_label.pack()
 
 
     def visualize_tree(self):
-        if self.tree is None:
+        if self.forest is None:
             self.result_label.config(text="Train the tree first.")
             return
-
-        G = nx.DiGraph()
-        pos = {}
-        labels = {}
-
-        def traverse(node, parent=None, direction='', depth=0, pos_x=0):
-            if node is None:
-                return
-
-            node_id = id(node)
-            label = f"{node.attr}\n{node.compare_symbol} {node.threshold:.1f}" if node.attr else f"Leaf\nVote: {node.vote}"
-            G.add_node(node_id)
-            labels[node_id] = label
-            pos[node_id] = (pos_x, -depth)
-
-            if parent is not None:
-                G.add_edge(parent, node_id, label=direction)
-
-            if node.left:
-                traverse(node.left, node_id, '<=', depth + 1, pos_x - 2 ** (3 - depth))
-            if node.right:
-                traverse(node.right, node_id, '>', depth + 1, pos_x + 2 ** (3 - depth))
-
-        traverse(self.tree)
-
-        plt.figure(figsize=(12, 8))
-        nx.draw(G, pos, with_labels=False, arrows=True, node_size=2000, node_color='skyblue')
-        nx.draw_networkx_labels(G, pos, labels)
-        edge_labels = nx.get_edge_attributes(G, 'label')
-        nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels)
-        plt.title("Decision Tree Visualization")
-        plt.tight_layout()
-        plt.show()
+        # Layouts are cached per model, so reopening the viewer is instant
+        if self.layouts is None or self.layouts.forest is not self.forest:
+            self.layouts = LayoutCache(self.forest)
+        TreeViewer(self.root, self.layouts)
 
     def create_input(self, parent, label, key, var=None):
         ttk.Label(parent, text=label).pack()
@@ -92,17 +90,74 @@ class SleepQualityApp:
         entry.pack()
         self.entries[key] = entry_var
 
+    def set_busy(self, busy):
+        self.busy = busy
+        state = "disabled" if busy else "normal"
+        self.upload_button.config(state=state)
+        self.train_button.config(state=state)
+        self.load_forest_button.config(state=state)
+        self.cancel_button.config(state="normal" if busy and self.progress is not None else "disabled")
+
+    def run_in_background(self, func, *args, progress=None):
+        # Loading and training run off the Tk thread; the worker only reports
+        # through self.results, which poll_worker reads on the Tk thread.
+        # One job at a time, so there is a single poll loop and its result
+        # always belongs to the job the buttons were disabled for.
+        if self.busy:
+            return False
+
+        def work():
+            try:
+                self.results.put(func(*args))
+            except TrainingCancelled:
+                self.results.put(("cancelled", None))
+            except Exception as e:
+                self.results.put(("error", e))
+
+        self.progress = progress
+        self.set_busy(True)
+        threading.Thread(target=work, daemon=True).start()
+        self.root.after(self.POLL_MS, self.poll_worker)
+        return True
+
+    def poll_worker(self):
+        if self.progress is not None:
+            self.progress_label.config(
+                text=f"Training: {self.progress.nodes} nodes built, depth {self.progress.depth_reached} reached")
+        try:
+            kind, value = self.results.get_nowait()
+        except queue.Empty:
+            self.root.after(self.POLL_MS, self.poll_worker)
+            return
+        if kind == "loaded":
+            self.df = value
+            self.result_label.config(text=f"Loaded {len(self.df)} rows. Labels binarized.")
+        elif kind == "trained":
+            self.forest = value
+            self.result_label.config(text="Tree trained successfully!")
+        elif kind == "forest":
+            self.forest = value
+            self.result_label.config(text=f"Loaded a forest of {value.n_trees} trees.")
+        elif kind == "cancelled":
+            self.result_label.config(text="Training cancelled.")
+        else:
+            self.result_label.config(text=f"Error: {value}")
+        self.progress = None
+        self.set_busy(False)
+
     def upload_csv(self):
         path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
-        if path:
-            self.df = pd.read_csv(path)
+        if path and self.run_in_background(self.load_csv, path):
+            self.result_label.config(text=f"Loading {path}...")
 
-            label_column = self.df.columns[-1]
-            median_value = self.df[label_column].median()
-            self.df["Label"] = (self.df[label_column] > median_value).astype(int)
-            self.df = self.df.drop(columns=[label_column])
+    def load_csv(self, path):
+        df = pd.read_csv(path)
 
-            self.result_label.config(text=f"Loaded {len(self.df)} rows. Labels binarized.")
+        label_column = df.columns[-1]
+        median_value = df[label_column].median()
+        df["Label"] = (df[label_column] > median_value).astype(int)
+        df = df.drop(columns=[label_column])
+        return "loaded", df
 
     def train_tree(self):
         if self.df is None:
@@ -113,39 +168,140 @@ class SleepQualityApp:
             self.result_label.config(text="Last column should be labeled as 'Label'.")
             return
 
+        try:
+            max_depth = self.depth_var.get()
+        except tk.TclError:
+            self.result_label.config(text="Max tree depth must be an integer.")
+            return
         criterion_func, optimize = parse_criterion(self.criterion_var.get())
-        self.tree = learn_tree(self.df, self.depth_var.get(), criterion_func, optimize)
-        self.result_label.config(text="Tree trained successfully!")
+        progress = ProgressStats()
+        if self.run_in_background(self.learn, self.df, max_depth, criterion_func, optimize, progress,
+                                  progress=progress):
+            self.result_label.config(text="Training...")
+
+    def learn(self, df, max_depth, criterion_func, optimize, progress):
+        data = TrainingData(df)
+        tree = learn_tree(data, max_depth, criterion_func, optimize, stats=progress)
+        return "trained", flatten_forest([tree], data.features)
+
+    def load_forest(self):
+        path = filedialog.askopenfilename(filetypes=[("Forest models", "*.model *.pkl"), ("All files", "*")])
+        if path and self.run_in_background(lambda: ("forest", load_flat(path))):
+            self.result_label.config(text=f"Loading {path}...")
+
+    def cancel_training(self):
+        if self.progress is not None:
+            self.progress.cancel()
+            self.progress_label.config(text="Cancelling...")
 
     def predict(self):
+        if self.forest is None:
+            self.result_label.config(text="Train the tree first.")
+            return
+
         try:
-            if self.tree is None:
-                self.result_label.config(text="Train the tree first.")
-                return
-
-            input_data = {
-                'Gender': int(self.entries['gender'].get()),
-                'Age': float(self.entries['age'].get()),
-                'Sleep Duration': float(self.entries['sleep_duration'].get()),
-                'Physical Activity': float(self.entries['physical_activity'].get()),
-                'BMI': float(self.entries['bmi'].get()),
-                'Stress Level': float(self.entries['stress_level'].get())
-            }
-            df_input = pd.DataFrame([input_data])
-
-            node = self.tree
-            while node.left is not None and node.right is not None:
-                value = df_input.iloc[0][node.attr]
-                if value <= node.threshold:
-                    node = node.left
-                else:
-                    node = node.right
-
-            prediction = node.vote if node is not None else "Unknown"
-            self.result_label.config(text=f"Predicted Sleep Quality: {prediction}")
-
-        except Exception as e:
+            values = {ENTRY_FEATURES[key]: float(var.get()) for key, var in self.entries.items() if key in ENTRY_FEATURES}
+            # Feature vector in the order of the trained tree
+            x = [values[name] for name in self.forest.features]
+        except KeyError as e:
+            self.result_label.config(text=f"Error: no input field for feature {e.args[0]}")
+            return
+        except (ValueError, tk.TclError) as e:
             self.result_label.config(text=f"Error: {str(e)}")
+            return
+
+        prediction = self.forest.predict_one(x)
+        self.result_label.config(text=f"Predicted Sleep Quality: {prediction}")
+
+
+class TreeViewer:
+    """
+    Window drawing one tree of a forest on a scrollable canvas. Subtrees below
+    COLLAPSE_DEPTH start collapsed; clicking an internal node collapses or
+    expands it, so only the visible part of a large tree is ever drawn.
+    """
+    COLLAPSE_DEPTH = 4
+
+    def __init__(self, root, layouts):
+        self.layouts = layouts
+        self.forest = layouts.forest
+        self.collapsed = {} # tree -> collapsed nodes
+        self.window = tk.Toplevel(root)
+        self.window.title("Decision Tree Visualization")
+
+        controls = ttk.Frame(self.window)
+        controls.pack(fill="x", padx=5, pady=5)
+        ttk.Label(controls, text="Tree:").pack(side="left")
+        self.tree_var = tk.IntVar(value=0)
+        ttk.Spinbox(controls, from_=0, to=self.forest.n_trees - 1, textvariable=self.tree_var, width=5,
+                    command=self.draw, state="readonly").pack(side="left", padx=5)
+        ttk.Button(controls, text="Expand All", command=self.expand_all).pack(side="left", padx=5)
+        ttk.Button(controls, text="Collapse", command=self.collapse).pack(side="left", padx=5)
+        ttk.Button(controls, text="Export...", command=self.export).pack(side="left", padx=5)
+
+        frame = ttk.Frame(self.window)
+        frame.pack(fill="both", expand=True)
+        self.canvas = tk.Canvas(frame, width=1000, height=600, background="white")
+        x_scroll = ttk.Scrollbar(frame, orient="horizontal", command=self.canvas.xview)
+        y_scroll = ttk.Scrollbar(frame, orient="vertical", command=self.canvas.yview)
+        self.canvas.configure(xscrollcommand=x_scroll.set, yscrollcommand=y_scroll.set)
+        x_scroll.pack(side="bottom", fill="x")
+        y_scroll.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.canvas.tag_bind("node", "<Button-1>", self.toggle)
+        self.draw()
+
+    def current_tree(self):
+        tree = self.tree_var.get()
+        if tree not in self.collapsed:
+            self.collapsed[tree] = collapsed_below(self.forest, tree, self.COLLAPSE_DEPTH)
+        return tree
+
+    def layout(self):
+        tree = self.current_tree()
+        return self.layouts.layout(tree, self.collapsed[tree])
+
+    def draw(self):
+        layout = self.layout()
+        canvas = self.canvas
+        canvas.delete("all")
+        for parent, child, branch in layout.edges:
+            (x1, y1), (x2, y2) = layout.position(parent), layout.position(child)
+            canvas.create_line(x1, y1 + NODE_HEIGHT / 2, x2, y2 - NODE_HEIGHT / 2, fill="#666")
+            canvas.create_text((x1 + x2) / 2, (y1 + y2) / 2, text=branch, fill="#444")
+        for i in layout.column:
+            x, y = layout.position(i)
+            fill = "#dddddd" if i in layout.collapsed else "#cfe3f7" if layout.is_open(i) else "#d8f0d0"
+            tags = ("node", f"n{i}")
+            canvas.create_rectangle(x - NODE_WIDTH / 2, y - NODE_HEIGHT / 2, x + NODE_WIDTH / 2, y + NODE_HEIGHT / 2,
+                                    fill=fill, outline="#555", tags=tags)
+            canvas.create_text(x, y, text="\n".join(layout.label(i)), tags=tags)
+        width, height = layout.size()
+        canvas.configure(scrollregion=(0, 0, width, height))
+
+    def toggle(self, event):
+        tags = self.canvas.gettags("current")
+        node = next(int(tag[1:]) for tag in tags if tag.startswith("n") and tag != "node")
+        if self.forest.feature[node] < 0:
+            return  # Leaves have nothing to expand
+        tree = self.current_tree()
+        self.collapsed[tree] = self.collapsed[tree] ^ {node}
+        self.draw()
+
+    def expand_all(self):
+        self.collapsed[self.current_tree()] = frozenset()
+        self.draw()
+
+    def collapse(self):
+        tree = self.current_tree()
+        self.collapsed[tree] = collapsed_below(self.forest, tree, self.COLLAPSE_DEPTH)
+        self.draw()
+
+    def export(self):
+        path = filedialog.asksaveasfilename(parent=self.window, defaultextension=".svg",
+                                            filetypes=[("SVG image", "*.svg"), ("Graphviz DOT", "*.dot")])
+        if path:
+            write_layout(self.layout(), path)
 
 
 if __name__ == "__main__":
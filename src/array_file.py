@@ -0,0 +1,72 @@
+import json
+import struct
+import numpy as np
+
+# Raw arrays behind a JSON header, shared by the model format (model_io.py)
+# and the dataset cache (dataset_cache.py).
+# File layout (all integers little-endian):
+#   magic (8 bytes) | version (uint32) | header length (uint32) | JSON header
+#   followed by the raw arrays, each starting on an ALIGN-byte boundary, so
+#   they can be memory-mapped in place. The header is padded with spaces so
+#   the data section starts aligned; where each array lies is up to the header.
+ALIGN = 64
+_PREAMBLE = struct.Struct("<8sII")
+
+
+def _align(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+def array_offsets(arrays):
+    """Byte offset of each array in the data section, and the section's size."""
+    offsets = []
+    offset = 0
+    for array in arrays:
+        offsets.append(offset)
+        offset = _align(offset + array.nbytes)
+    return offsets, offset
+
+
+def write_arrays(f, magic, version, header, arrays):
+    """Write the preamble, a JSON-serializable header and the arrays to an open binary file."""
+    offsets, size = array_offsets(arrays)
+    header = json.dumps(header).encode("utf-8")
+    data_start = _align(_PREAMBLE.size + len(header))
+    header += b" " * (data_start - _PREAMBLE.size - len(header))
+    f.write(_PREAMBLE.pack(magic, version, len(header)))
+    f.write(header)
+    for offset, array in zip(offsets, arrays):
+        f.seek(data_start + offset)
+        f.write(array.tobytes())
+    f.truncate(data_start + size)
+
+
+def has_magic(file_name, magic):
+    with open(file_name, "rb") as f:
+        return f.read(len(magic)) == magic
+
+
+def read_header(file_name, magic):
+    """
+    (version, JSON header, data section offset) of a file, or None if it does
+    not start with magic.
+    """
+    with open(file_name, "rb") as f:
+        preamble = f.read(_PREAMBLE.size)
+        if len(preamble) < _PREAMBLE.size:
+            return None
+        found, version, header_len = _PREAMBLE.unpack(preamble)
+        if found != magic:
+            return None
+        return version, json.loads(f.read(header_len).decode("utf-8")), _PREAMBLE.size + header_len
+
+
+def open_data(file_name, mmap=True):
+    """The whole file as bytes: a read-only memory map, or a copy read into memory."""
+    return np.memmap(file_name, dtype=np.uint8, mode="r") if mmap else np.fromfile(file_name, dtype=np.uint8)
+
+
+def view_array(data, start, dtype, count):
+    """The count items of dtype at byte offset start of open_data's bytes, without copying."""
+    dtype = np.dtype(dtype)
+    return data[start:start + count * dtype.itemsize].view(dtype)
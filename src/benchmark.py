@@ -0,0 +1,171 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import numpy as np
+import pandas as pd
+from decision_tree import TrainingData, parse_criterion
+from forest import flatten_forest
+from train import train_forest
+
+# Columns of data/train.tsv (label last); extra features are appended as Extra_<k>
+SCHEMA = ["Sleep_Hours", "Age", "Gender", "BMI", "Physical_Activity_Level", "Stress_Level"]
+LABEL = "Sleep_Quality_Score"
+CRITERIA = ["gini", "mutual_information", "lowest_variance"]
+
+
+def make_dataset(rows, features=len(SCHEMA), cardinality=None, noise=0.1, seed=0):
+    """
+    Generate a synthetic dataset with the schema of data/train.tsv.
+    Continuous columns are rounded to at most `cardinality` distinct values
+    (None keeps them at their natural resolution). The label follows sleep
+    hours and stress like the real data, with a fraction `noise` flipped.
+    """
+    rng = np.random.default_rng(seed)
+    columns = {
+        "Sleep_Hours": np.round(rng.normal(7.0, 1.0, rows).clip(3, 11), 1),
+        "Age": rng.integers(18, 80, rows),
+        "Gender": rng.integers(0, 2, rows),
+        "BMI": np.round(rng.normal(25.0, 4.0, rows).clip(15, 45), 1),
+        "Physical_Activity_Level": np.round(rng.uniform(0, 10, rows), 1),
+        "Stress_Level": rng.integers(0, 41, rows),
+    }
+    df = pd.DataFrame({name: columns[name] for name in SCHEMA[:features]})
+    for k in range(len(SCHEMA), features):
+        df[f"Extra_{k + 1}"] = np.round(rng.normal(0.0, 1.0, rows), 3)
+    if cardinality is not None:
+        for name in df.columns:
+            values = df[name].to_numpy()
+            if len(np.unique(values)) > cardinality:
+                edges = np.quantile(values, np.linspace(0, 1, cardinality + 1)[1:-1])
+                df[name] = np.round(edges[np.searchsorted(edges, values).clip(0, len(edges) - 1)], 3)
+    score = (columns["Sleep_Hours"] - 7.0) - (columns["Stress_Level"] - 20) / 15.0 + rng.normal(0, 0.5, rows)
+    label = (score >= np.median(score)).astype(int)
+    flip = rng.random(rows) < noise
+    df[LABEL] = np.where(flip, 1 - label, label)
+    return df
+
+
+def time_call(func, repeat):
+    """Best wall time of `repeat` calls, and the result of the last one."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_benchmarks(rows_list, criteria, depths, features, cardinality, noise, n_trees, jobs, repeat):
+    results = []
+    for rows in rows_list:
+        df = make_dataset(rows, features, cardinality, noise)
+        data = TrainingData(df)
+        for criterion in criteria:
+            parsed = parse_criterion(criterion)
+            for depth in depths:
+                train_seconds, subtrees = time_call(
+                    lambda: train_forest(data, depth, parsed, n_trees=n_trees, jobs=jobs), repeat)
+                forest = flatten_forest(subtrees, data.features, criterion)
+                predict_seconds, _ = time_call(lambda: forest.predict_batch(data.X), repeat)
+                result = {
+                    "rows": rows,
+                    "criterion": criterion,
+                    "max_depth": depth,
+                    "nodes": len(forest.feature),
+                    "train_seconds": train_seconds,
+                    "predict_seconds": predict_seconds,
+                }
+                print(f"rows={rows} criterion={criterion} depth={depth}: "
+                      f"train {train_seconds:.4f}s, predict {predict_seconds:.4f}s", file=sys.stderr)
+                results.append(result)
+    return results
+
+
+# Settings that change what is measured; timings taken with different values are not comparable
+DATASET_CONFIG = ("features", "cardinality", "noise", "trees", "jobs")
+
+
+def config_mismatches(baseline_config, config):
+    """Names of the DATASET_CONFIG settings that differ between a baseline run and this one."""
+    return [key for key in DATASET_CONFIG if baseline_config.get(key) != config.get(key)]
+
+
+def result_key(result):
+    return (result["rows"], result["criterion"], result["max_depth"])
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Compare timings with a stored baseline run. Returns a list of regression
+    messages for every timing more than `tolerance` (fractional) slower.
+    """
+    previous = {result_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get(result_key(result))
+        if old is None:
+            continue
+        for metric in ("train_seconds", "predict_seconds"):
+            ratio = result[metric] / old[metric] if old[metric] > 0 else 1.0
+            result[metric + "_vs_baseline"] = ratio
+            if ratio > 1 + tolerance:
+                regressions.append(f"rows={result['rows']} criterion={result['criterion']} "
+                                   f"depth={result['max_depth']} {metric}: {old[metric]:.4f}s -> "
+                                   f"{result[metric]:.4f}s ({ratio:.2f}x)")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time training and prediction on synthetic data")
+    parser.add_argument("output", type=str, help='Path to the output JSON results file')
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help='Dataset sizes to benchmark')
+    parser.add_argument("--criteria", nargs="+", default=CRITERIA, help='Splitting criteria to benchmark')
+    parser.add_argument("--depths", type=int, nargs="+", default=list(range(1, 7)), help='Maximum depths to benchmark')
+    parser.add_argument("--features", type=int, default=len(SCHEMA), help='Number of feature columns')
+    parser.add_argument("--cardinality", type=int, default=None,
+                        help='Maximum number of distinct values per feature (default: unlimited)')
+    parser.add_argument("--noise", type=float, default=0.1, help='Fraction of labels flipped at random')
+    parser.add_argument("--trees", type=int, default=3, help='Number of trees per forest')
+    parser.add_argument("--jobs", type=int, default=1, help='Worker processes used for training')
+    parser.add_argument("--repeat", type=int, default=3, help='Runs per measurement (the best is kept)')
+    parser.add_argument("--baseline", type=str, default=None, help='Results file of an earlier run to compare against')
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help='Allowed slowdown against the baseline before reporting a regression')
+    parser.add_argument("--write-data", type=str, default=None,
+                        help='Also write the largest generated dataset to this TSV file')
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "write_data")}
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        mismatches = config_mismatches(baseline.get("config", {}), config)
+        if mismatches:
+            sys.exit(f"Cannot compare with {args.baseline}: it was run with different "
+                     + ", ".join(f"--{key} ({baseline.get('config', {}).get(key)} vs {config[key]})" for key in mismatches))
+
+    results = run_benchmarks(args.rows, args.criteria, args.depths, args.features, args.cardinality,
+                             args.noise, args.trees, args.jobs, args.repeat)
+    report = {
+        "config": config,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+    regressions = []
+    if baseline is not None:
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        report["regressions"] = regressions
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    if args.write_data is not None:
+        make_dataset(max(args.rows), args.features, args.cardinality, args.noise).to_csv(args.write_data, sep="\t", index=False)
+
+    for message in regressions:
+        print("REGRESSION " + message)
+    sys.exit(1 if regressions else 0)
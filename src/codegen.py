@@ -0,0 +1,151 @@
+import argparse
+import importlib.util
+import os
+import numpy as np
+from forest import FlatForest, flatten_forest
+from model_io import load_model
+from test import load_dataset, predict_forest
+
+HEADER = '''"""
+Forest compiled by src/codegen.py from {source}. Do not edit.
+
+Features (in this order): {features}
+predict_one(x) scores a single sequence of feature values and
+predict_record(record) a {{feature: value}} mapping: this is the fast path
+for single records. predict(X) scores an (n_rows, n_features) matrix but
+evaluates every branch of every tree over all rows, so for large batches
+FlatForest.predict_batch is faster. Ties between the trees' votes go to 1,
+as in the forest.
+"""
+import numpy as np
+
+FEATURES = {feature_list!r}
+N_TREES = {n_trees}
+'''
+
+
+def tree_nodes(forest, root):
+    """Node indices of the tree rooted at root, in preorder."""
+    stack = [root]
+    while stack:
+        i = stack.pop()
+        yield i
+        if forest.feature[i] >= 0:
+            stack += [forest.right[i], forest.left[i]]
+
+
+def emit_nested(forest, i, lines, indent):
+    """The tree below node i as nested if/else statements returning the leaf vote."""
+    pad = "    " * indent
+    if forest.feature[i] < 0:
+        lines.append(f"{pad}return {int(forest.vote[i])}")
+        return
+    lines.append(f"{pad}if x{forest.feature[i]} <= {float(forest.threshold[i])!r}:")
+    emit_nested(forest, forest.left[i], lines, indent + 1)
+    lines.append(f"{pad}else:")
+    emit_nested(forest, forest.right[i], lines, indent + 1)
+
+
+def emit_where(forest, i):
+    """The tree below node i as one np.where expression over the feature columns."""
+    if forest.feature[i] < 0:
+        return str(int(forest.vote[i]))
+    return (f"np.where(x{forest.feature[i]} <= {float(forest.threshold[i])!r}, "
+            f"{emit_where(forest, forest.left[i])}, {emit_where(forest, forest.right[i])})")
+
+
+def generate_module(forest, source="a forest"):
+    """
+    Python source of a module scoring the forest without any model object:
+    every tree becomes nested comparisons on local variables (single rows)
+    and an np.where cascade (batches). Feature j is the local variable xj.
+    The cascade computes both sides of every split for all rows, so batch
+    scoring should keep using FlatForest.predict_batch.
+    """
+    n_features = len(forest.features)
+    args = ", ".join(f"x{j}" for j in range(n_features))
+    parts = [HEADER.format(source=source, features=", ".join(forest.features),
+                           feature_list=list(forest.features), n_trees=forest.n_trees)]
+    for t, root in enumerate(forest.roots):
+        used = sorted({int(forest.feature[i]) for i in tree_nodes(forest, root) if forest.feature[i] >= 0})
+        lines = [f"def tree_{t}({args}):"]
+        emit_nested(forest, root, lines, 1)
+        lines += ["", "", f"def tree_{t}_batch({args}):"]
+        if used:
+            lines.append(f"    return {emit_where(forest, root)}")
+        else:
+            # A single leaf: broadcast its vote over the rows
+            lines.append(f"    return np.full(len(x0), {int(forest.vote[root])})")
+        parts.append("\n".join(lines) + "\n")
+    votes = " + ".join(f"tree_{t}({args})" for t in range(forest.n_trees)) or "0"
+    batch_votes = " + ".join(f"tree_{t}_batch({args})" for t in range(forest.n_trees)) or "0"
+    parts.append(f'''def predict_one(x):
+    """Prediction (0 or 1) for one sequence of feature values in FEATURES order."""
+    {args}, = x
+    return 1 if 2 * ({votes}) >= N_TREES else 0
+
+
+def predict_record(record):
+    """Prediction (0 or 1) for a {{feature: value}} mapping."""
+    return predict_one([float(record[name]) for name in FEATURES])
+
+
+def predict(X):
+    """Predictions for every row of an (n_rows, n_features) matrix in FEATURES order."""
+    X = np.asarray(X, dtype=float).reshape(-1, {n_features})
+    {args}, = X.T
+    return (2 * ({batch_votes}) >= N_TREES).astype(int)
+''')
+    return "\n\n".join(parts)
+
+
+def write_module(forest, file_name, source="a forest"):
+    with open(file_name, "w") as f:
+        f.write(generate_module(forest, source))
+
+
+def load_module(file_name):
+    """Import a generated module from its path."""
+    name = os.path.splitext(os.path.basename(file_name))[0]
+    spec = importlib.util.spec_from_file_location(name, file_name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def verify_module(module, model, df):
+    """
+    Compare the generated module with the interpreted forest on the rows of
+    df: the batch and single-row entry points against FlatForest.predict_batch,
+    and against predict_forest when the model is a list of Node trees.
+    Returns the number of rows on which they disagree.
+    """
+    forest = model if isinstance(model, FlatForest) else flatten_forest(model, df.columns[:-1])
+    X = forest.feature_matrix(df)
+    expected = forest.predict_batch(X)
+    mismatches = (module.predict(X) != expected) | (np.array([module.predict_one(x) for x in X]) != expected)
+    if not isinstance(model, FlatForest):
+        interpreted = np.array([predict_forest(row, model) for _, row in df.iterrows()])
+        mismatches |= interpreted != expected
+    return int(mismatches.sum())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compile a trained forest into an importable Python module")
+    parser.add_argument("model_input", type=str, help='Path to the trained forest (model file or legacy pickle)')
+    parser.add_argument("module_out", type=str, help='Path of the generated module (e.g., train/forest_model.py)')
+    parser.add_argument("--schema", type=str, default="data/train.tsv",
+                        help='TSV file whose columns give the feature order of a legacy pickle')
+    parser.add_argument("--verify", type=str, default=None,
+                        help='TSV file (e.g., data/test.tsv) on which the module must match the interpreted forest')
+    args = parser.parse_args()
+
+    model = load_model(args.model_input)
+    forest = model if isinstance(model, FlatForest) else flatten_forest(model, load_dataset(args.schema).columns[:-1])
+    write_module(forest, args.module_out, args.model_input)
+    print(f"Compiled {forest.n_trees} trees ({len(forest.feature)} nodes) to {args.module_out}")
+    if args.verify is not None:
+        mismatches = verify_module(load_module(args.module_out), model, load_dataset(args.verify))
+        print(f"Verification on {args.verify}: {mismatches} mismatching rows")
+        if mismatches:
+            raise SystemExit(1)
@@ -2,6 +2,7 @@ import argparse
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
+from dataset_cache import build_cache, cache_path
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Preprocess and split the Sleep dataset.")
@@ -33,9 +34,14 @@ if __name__ == '__main__':
     train_df.to_csv(args.train_output, sep="\t", index=False)
     test_df.to_csv(args.test_output, sep="\t", index=False)
 
+    # Columnar binary caches next to the TSVs, loaded by training and testing.
+    for output in (args.all_train_output, args.train_output, args.test_output):
+        build_cache(output)
+
     print("Data processing complete:")
     print(f"Full dataset shape: {df.shape}")
     print(f"Training data shape: {train_df.shape}")
     print(f"Test data shape: {test_df.shape}")
+    print(f"Column caches: {cache_path(args.train_output)}, {cache_path(args.test_output)}")
     print("Training target distribution:")
     print(train_df["Sleep_Quality_Score"].value_counts())
@@ -0,0 +1,164 @@
+import argparse
+import hashlib
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import array_file
+
+# Columnar cache of a TSV dataset, written next to it as <file>.cols: an
+# array_file with one array per column. The header holds the SHA-256 of the
+# TSV it was built from, the number of rows, the label column and every
+# column's name, dtype and byte offset.
+MAGIC = b"DTCOLUMN"
+VERSION = 1
+SUFFIX = ".cols"
+
+
+def cache_path(file_name):
+    return file_name + SUFFIX
+
+
+def file_hash(file_name):
+    """SHA-256 of a file's content, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_columns(df, file_name, source_hash=None, mode=0o644):
+    """
+    Write a DataFrame of numeric columns (label last) as a columnar cache file.
+    The file is written under a temporary name and renamed into place, so
+    concurrent readers never see a partial cache; it gets the permission bits
+    mode (mkstemp alone would leave it readable by its owner only).
+    """
+    arrays = {}
+    for name in df.columns:
+        array = df[name].to_numpy()
+        if array.dtype.kind not in "biuf":
+            raise ValueError(f"Column {name} has unsupported dtype {array.dtype}")
+        arrays[name] = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
+    offsets, _ = array_file.array_offsets(arrays.values())
+    header = {
+        "source_sha256": source_hash,
+        "rows": len(df),
+        "label": df.columns[-1],
+        "columns": [{"name": name, "dtype": array.dtype.str, "offset": offset}
+                    for (name, array), offset in zip(arrays.items(), offsets)],
+    }
+    directory = os.path.dirname(os.path.abspath(file_name))
+    fd, tmp_name = tempfile.mkstemp(dir=directory, suffix=SUFFIX + ".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            array_file.write_arrays(f, MAGIC, VERSION, header, list(arrays.values()))
+        os.chmod(tmp_name, mode)
+        os.replace(tmp_name, file_name)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def read_header(file_name):
+    """The JSON header and data offset of a cache file, or None if it is not one."""
+    found = array_file.read_header(file_name, MAGIC)
+    if found is None or found[0] != VERSION:
+        return None
+    return found[1:]
+
+
+def load_columns(file_name, mmap=True):
+    """
+    Open a cache file as a DataFrame whose columns are read-only views of the
+    memory-mapped file: nothing is parsed or copied.
+    """
+    header, data_start = read_header(file_name)
+    raw = array_file.open_data(file_name, mmap)
+    columns = {spec["name"]: array_file.view_array(raw, data_start + spec["offset"], spec["dtype"], header["rows"])
+               for spec in header["columns"]}
+    return pd.DataFrame(columns, copy=False)
+
+
+def build_cache(file_name):
+    """
+    Parse a TSV file once and write its cache. The cached columns are exactly
+    what pd.read_csv returns, so results do not depend on which one is read.
+    Returns the parsed DataFrame.
+    """
+    source_hash = file_hash(file_name)
+    df = pd.read_csv(file_name, sep="\t")
+    try:
+        # Whoever can read the TSV can read its cache
+        save_columns(df, cache_path(file_name), source_hash, os.stat(file_name).st_mode & 0o777)
+    except (OSError, ValueError):
+        pass  # Read-only location or non-numeric data: keep working from the TSV
+    return df
+
+
+def valid_cache(file_name):
+    """
+    Path of the cache of a TSV file if it exists, is readable and matches the
+    file's content, else None.
+    """
+    cache_file = cache_path(file_name)
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        found = read_header(cache_file)
+    except (OSError, ValueError):
+        return None  # Unreadable (e.g. written by another user) or corrupt: use the TSV
+    if found is None or found[0]["source_sha256"] != file_hash(file_name):
+        return None
+    return cache_file
+
+
+def load_dataset(file_name, use_cache=True):
+    """
+    Read a TSV file into a DataFrame, from its columnar cache when that is up
+    to date; otherwise the file is parsed and the cache (re)built.
+    """
+    if not use_cache:
+        return pd.read_csv(file_name, sep="\t")
+    cache_file = valid_cache(file_name)
+    if cache_file is not None:
+        return load_columns(cache_file)
+    return build_cache(file_name)
+
+
+def count_rows(file_name):
+    """
+    Number of data rows of a TSV file without parsing it: from the header of
+    its cache when that is up to date, otherwise by counting non-blank lines.
+    """
+    cache_file = valid_cache(file_name)
+    if cache_file is not None:
+        return read_header(cache_file)[0]["rows"]
+    with open(file_name, "rb") as f:
+        return sum(1 for line in f if line.strip()) - 1
+
+
+def read_chunks(file_name, chunksize, use_cache=True):
+    """
+    Iterate over a TSV file in DataFrames of chunksize rows, sliced from the
+    memory-mapped cache when it is up to date (the cache is not built here,
+    so memory stays bounded by the chunk size either way).
+    """
+    cache_file = valid_cache(file_name) if use_cache else None
+    if cache_file is None:
+        yield from pd.read_csv(file_name, sep="\t", chunksize=chunksize)
+        return
+    df = load_columns(cache_file)
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the columnar binary cache of TSV datasets")
+    parser.add_argument("inputs", nargs="+", help='TSV files to cache (each gets <file>.cols next to it)')
+    args = parser.parse_args()
+
+    for file_name in args.inputs:
+        df = build_cache(file_name)
+        print(f"{cache_path(file_name)}: {len(df)} rows, {len(df.columns)} columns")
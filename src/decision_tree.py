@@ -1,53 +1,193 @@
+import copy
 import math
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import numpy as np
 import pandas as pd
 
-def mutual_information(X, Y):
-    ent_Y = entropy(Y)
-    num_0_in_X = X.count(0)
-    if num_0_in_X > 0:
-        ent_Xis0 = entropy([y for x, y in zip(X, Y) if x == 0]) * (num_0_in_X / len(X))
-    else:
-        ent_Xis0 = 0
-    num_1_in_X = X.count(1)
-    if num_1_in_X > 0:
-        ent_Xis1 = entropy([y for x, y in zip(X, Y) if x == 1]) * (num_1_in_X / len(X))
-    else:
-        ent_Xis1 = 0
+def contingency_counts(X, Y, weights=None):
+    """
+    Count the labels by attribute value for every column of X in one call.
+    Returns an array of shape (n_attributes, 3, 2) where counts[j, v, c] is the
+    number of rows with label c whose value in column j is 0 (v=0), 1 (v=1) or
+    anything else (v=2). The criteria below score all attributes from it.
+    With weights, each row counts as many times as its (integer) weight.
+    """
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y)
+    onehot = np.stack([Y == 0, Y == 1], axis=1).astype(float)
+    if weights is not None:
+        onehot *= np.asarray(weights, dtype=float)[:, None]
+    counts_0 = (X == 0).T.astype(float) @ onehot
+    counts_1 = (X == 1).T.astype(float) @ onehot
+    counts_other = onehot.sum(axis=0) - counts_0 - counts_1
+    return np.stack([counts_0, counts_1, counts_other], axis=1)
+
+# math.log applied elementwise: only one value per attribute reaches it, and it
+# keeps scores bit-identical to the scalar implementation so ties resolve the same
+_log = np.frompyfunc(math.log, 2, 1)
+
+def entropy(label_counts):
+    """Binary entropy (in bits) of [..., (# of 0 labels, # of 1 labels)] counts."""
+    label_counts = np.asarray(label_counts, dtype=float)
+    num_0 = label_counts[..., 0]
+    num_1 = label_counts[..., 1]
+    total = num_0 + num_1
+    mixed = (num_0 > 0) & (num_1 > 0)
+    p_0 = np.where(mixed, num_0, 1) / np.where(mixed, total, 1)
+    p_1 = np.where(mixed, num_1, 1) / np.where(mixed, total, 1)
+    ent = - (p_0 * _log(p_0, 2).astype(float) + p_1 * _log(p_1, 2).astype(float))
+    return np.where(mixed, ent, 0.0)
+
+def mutual_information(counts):
+    ent_Y = entropy(counts.sum(axis=1))
+    n = counts.sum(axis=(1, 2))
+    ent_Xis0 = entropy(counts[:, 0]) * (counts[:, 0].sum(axis=1) / n)
+    ent_Xis1 = entropy(counts[:, 1]) * (counts[:, 1].sum(axis=1) / n)
     return ent_Y - ent_Xis0 - ent_Xis1
 
-def entropy(array):
-    num_0 = array.count(0)
-    num_1 = array.count(1)
-    if num_0 == 0 or num_1 == 0:
-        return 0
-    p_0 = num_0 / len(array)
-    p_1 = num_1 / len(array)
-    return - (p_0 * math.log(p_0, 2) + p_1 * math.log(p_1, 2))
-
-def gini_index(X, Y):
-    total = len(Y)
-    indices0 = [i for i, x in enumerate(X) if x == 0]
-    indices1 = [i for i, x in enumerate(X) if x == 1]
-    
-    def impurity(indices):
-        if len(indices) == 0:
-            return 0
-        subset = [Y[i] for i in indices]
-        p0 = subset.count(0) / len(subset)
-        p1 = subset.count(1) / len(subset)
-        return 1 - (p0**2 + p1**2)
-    
-    weighted_impurity = (len(indices0)/total) * impurity(indices0) + (len(indices1)/total) * impurity(indices1)
+def gini_index(counts):
+    total = counts.sum(axis=(1, 2))
+
+    def impurity(side):
+        size = side.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            p0 = side[:, 0] / size
+            p1 = side[:, 1] / size
+            imp = 1 - (p0**2 + p1**2)
+        return np.where(size == 0, 0.0, imp)
+
+    weighted_impurity = (counts[:, 0].sum(axis=1) / total) * impurity(counts[:, 0]) + (counts[:, 1].sum(axis=1) / total) * impurity(counts[:, 1])
     return weighted_impurity
 
-def lowest_variance(X, Y):
-    p = X.count(1) / len(X)
+def lowest_variance(counts):
+    p = counts[:, 1].sum(axis=1) / counts.sum(axis=(1, 2))
     return p * (1 - p)
 
+def threshold_scores(values, labels, weights=None):
+    """
+    Score all candidate thresholds of a single feature at once.
+    The values are sorted once; the label counts to the left of every midpoint
+    between consecutive unique values come from a cumulative sum, and each
+    split is scored with the weighted Gini impurity of its two sides.
+    Rows count as many times as their (integer) weights, if given.
+    Returns (thresholds, scores) as arrays in increasing threshold order.
+    """
+    unique_vals, inverse = np.unique(values, return_inverse=True)
+    if len(unique_vals) < 2:
+        return np.empty(0), np.empty(0)
+    if weights is None:
+        weights = np.ones(len(inverse))
+    weights = np.asarray(weights, dtype=float)
+    totals = np.bincount(inverse, weights=weights, minlength=len(unique_vals))
+    ones = np.bincount(inverse, weights=weights * (labels == 1), minlength=len(unique_vals))
+    n = totals.sum()
+    # Candidate i puts unique values 0..i on the left side
+    n_left = np.cumsum(totals)[:-1]
+    ones_left = np.cumsum(ones)[:-1]
+    scores = split_scores(n_left, ones_left, n, ones.sum())
+    thresholds = (unique_vals[:-1] + unique_vals[1:]) / 2.0
+    return thresholds, scores
+
+def split_scores(n_left, ones_left, n, ones):
+    """
+    Weighted Gini impurity of the two sides of candidate splits, given the
+    (weighted) row and label-1 counts on the left and at the whole node.
+    """
+    n_right = n - n_left
+    ones_right = ones - ones_left
+
+    def gini(ones_side, n_side):
+        p = ones_side / n_side
+        return 1 - p**2 - (1 - p)**2
+
+    return (n_left / n) * gini(ones_left, n_left) + (n_right / n) * gini(ones_right, n_right)
+
+def histogram_split(totals, ones, lower, upper):
+    """
+    Best threshold of one feature from per-bin histograms, for several nodes
+    at once: totals and ones hold the (weighted) row and label-1 counts of
+    every bin, one node per row. Candidates lie between consecutive non-empty
+    bins and are scored like threshold_scores; the threshold is the midpoint
+    between the largest training value of the left bin (upper) and the
+    smallest of the next non-empty bin (lower), so it stays a real value.
+    Returns (thresholds, scores) per node, NaN and inf where no split exists.
+    """
+    n_nodes, n_bins = totals.shape
+    present = totals > 0
+    # First non-empty bin strictly after every bin (n_bins if none)
+    index = np.where(present, np.arange(n_bins), n_bins)
+    next_bin = np.full((n_nodes, n_bins), n_bins)
+    next_bin[:, :-1] = np.minimum.accumulate(index[:, :0:-1], axis=1)[:, ::-1]
+    valid = present & (next_bin < n_bins)
+    n_left = np.cumsum(totals, axis=1)
+    ones_left = np.cumsum(ones, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = np.where(valid, split_scores(n_left, ones_left, n_left[:, -1:], ones_left[:, -1:]), np.inf)
+    # argmin keeps the first (lowest) threshold on ties
+    best = np.argmin(scores, axis=1)
+    nodes = np.arange(n_nodes)
+    best_scores = scores[nodes, best]
+    thresholds = (upper[best] + lower[np.minimum(next_bin[nodes, best], n_bins - 1)]) / 2.0
+    thresholds[~np.isfinite(best_scores)] = np.nan
+    return thresholds, best_scores
+
+class FeatureBins:
+    """
+    Quantile bins of every feature, computed once before training: codes is
+    the uint8 matrix of bin numbers, and upper[j, b] / lower[j, b] are the
+    largest / smallest training value of feature j in bin b. A feature with
+    at most n_bins distinct values gets one bin per value, so its splits are
+    the same as without binning.
+    """
+    def __init__(self, X, n_bins=255):
+        if not 2 <= n_bins <= 256:
+            raise ValueError("n_bins must be between 2 and 256: " + str(n_bins))
+        X = np.asarray(X, dtype=float)
+        codes = np.empty(X.shape, dtype=np.uint8)
+        upper = np.full((X.shape[1], n_bins), np.nan)
+        lower = np.full((X.shape[1], n_bins), np.nan)
+        for j in range(X.shape[1]):
+            values = X[:, j]
+            unique_vals = np.unique(values)
+            if len(unique_vals) <= n_bins:
+                bounds = unique_vals
+            else:
+                # Bin edges are training values, so every bin knows its largest value
+                bounds = np.unique(np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:], method='inverted_cdf'))
+            codes[:, j] = np.searchsorted(bounds, values)
+            upper[j, :len(bounds)] = bounds
+            previous = np.concatenate([[-np.inf], bounds[:-1]])
+            lower[j, :len(bounds)] = unique_vals[np.searchsorted(unique_vals, previous, side='right')]
+        self.set_arrays(codes, lower, upper)
+
+    @classmethod
+    def from_arrays(cls, codes, lower, upper):
+        bins = cls.__new__(cls)
+        bins.set_arrays(codes, lower, upper)
+        return bins
+
+    def set_arrays(self, codes, lower, upper):
+        self.codes = codes
+        self.lower = lower
+        self.upper = upper
+        self.n_bins = upper.shape[1]
+
+    def best_thresholds(self, j, rows, slot, n_nodes, weights, ones):
+        """histogram_split of feature j for the rows of n_nodes nodes (node of each row in slot)."""
+        key = slot * self.n_bins + self.codes[rows, j]
+        totals = np.bincount(key, weights=weights, minlength=n_nodes * self.n_bins).reshape(n_nodes, self.n_bins)
+        label_ones = np.bincount(key, weights=ones, minlength=n_nodes * self.n_bins).reshape(n_nodes, self.n_bins)
+        return histogram_split(totals, label_ones, self.lower[j], self.upper[j])
+
 def parse_criterion(criterion):
     """
     Given a string, return a tuple: (criterion_function, optimization_direction).
     For 'mutual_information' we maximize; for 'gini' or 'lowest_variance' we minimize.
+    Criterion functions take a contingency_counts() table and return one score
+    per attribute.
     """
     criterion = criterion.lower()
     if criterion == 'mutual_information':
@@ -59,85 +199,251 @@ def parse_criterion(criterion):
     else:
         raise ValueError("Unknown criterion: " + criterion)
 
+class TrainingData:
+    """
+    Feature matrix and labels shared by every node of a tree while it is learned.
+    Nodes only keep an array of row indices into it, never a copy of the data.
+    Set bins to a FeatureBins to search thresholds on bin histograms.
+    """
+    def __init__(self, df):
+        self.set_arrays(df.iloc[:, :-1].to_numpy(dtype=float), df.iloc[:, -1].to_numpy(), df.columns)
+
+    @classmethod
+    def from_arrays(cls, X, y, columns, bins=None):
+        """Wrap existing arrays (e.g. memory-mapped ones) without copying them."""
+        data = cls.__new__(cls)
+        data.set_arrays(X, y, columns, bins)
+        return data
+
+    def set_arrays(self, X, y, columns, bins=None):
+        self.columns = list(columns)
+        self.features = self.columns[:-1]
+        self.feature_index = {attr: j for j, attr in enumerate(self.features)}
+        self.X = X
+        self.y = y
+        self.bins = bins
+
+    def __len__(self):
+        return len(self.y)
+
+class TrainingStats:
+    """
+    Instrumentation for tree learning: wall time per phase (attribute scoring,
+    threshold search, partitioning), nodes built per depth, leaves and rows
+    scanned. Pass one to learn_tree to collect them; training is silent and
+    uninstrumented otherwise.
+    """
+    PHASES = ("attribute_scoring", "threshold_search", "partitioning")
+
+    def __init__(self):
+        self.phase_seconds = defaultdict(float)
+        self.nodes_per_depth = Counter()
+        self.leaves = 0
+        self.rows_scanned = 0
+
+    @contextmanager
+    def phase(self, name, rows=0):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_seconds[name] += time.perf_counter() - start
+            self.rows_scanned += rows
+
+    def node_built(self, depth):
+        self.nodes_per_depth[depth] += 1
+
+    def leaf_built(self):
+        self.leaves += 1
+
+    def merge(self, other):
+        """Add the statistics of another run (e.g. from a worker process)."""
+        for name, seconds in other.phase_seconds.items():
+            self.phase_seconds[name] += seconds
+        self.nodes_per_depth.update(other.nodes_per_depth)
+        self.leaves += other.leaves
+        self.rows_scanned += other.rows_scanned
+
+    def to_dict(self):
+        return {
+            "phase_seconds": {name: self.phase_seconds[name] for name in self.PHASES},
+            "nodes_per_depth": {str(depth): n for depth, n in sorted(self.nodes_per_depth.items())},
+            "nodes": sum(self.nodes_per_depth.values()),
+            "leaves": self.leaves,
+            "rows_scanned": self.rows_scanned,
+        }
+
+class NullStats(TrainingStats):
+    """Stand-in used when no statistics are requested; records nothing."""
+    @contextmanager
+    def phase(self, name, rows=0):
+        yield
+
+    def node_built(self, depth):
+        pass
+
+    def leaf_built(self):
+        pass
+
+NULL_STATS = NullStats()
+
+class TrainingCancelled(Exception):
+    """Raised inside learn_tree once its ProgressStats has been cancelled."""
+
+class ProgressStats(NullStats):
+    """
+    Progress of a learn_tree running in another thread: nodes built so far and
+    the deepest depth reached, safe to poll at any time. cancel() stops the
+    training at the next node by raising TrainingCancelled in its thread.
+    """
+    def __init__(self):
+        super().__init__()
+        self.nodes = 0
+        self.depth_reached = 0
+        self.cancelled = threading.Event()
+
+    def node_built(self, depth):
+        if self.cancelled.is_set():
+            raise TrainingCancelled()
+        self.nodes += 1
+        self.depth_reached = max(self.depth_reached, depth)
+
+    def cancel(self):
+        self.cancelled.set()
+
+def resolve_max_features(max_features, n_features):
+    """
+    Number of attributes to consider per split: None or 'all' for all of them,
+    'sqrt' or 'log2' of the number of attributes, a fraction (float) of them,
+    or an explicit count (int). Always at least 1 and at most n_features.
+    """
+    if max_features is None or max_features == 'all':
+        return n_features
+    if max_features == 'sqrt':
+        k = int(math.sqrt(n_features))
+    elif max_features == 'log2':
+        k = int(math.log2(n_features)) if n_features > 0 else 0
+    elif isinstance(max_features, float):
+        if not 0 < max_features <= 1:
+            raise ValueError("max_features as a fraction must be in (0, 1]: " + str(max_features))
+        k = int(max_features * n_features)
+    elif isinstance(max_features, int):
+        k = max_features
+    else:
+        raise ValueError("Unknown max_features: " + str(max_features))
+    return max(1, min(n_features, k))
+
+def parse_max_features(text):
+    """Parse a command line max_features value ('sqrt', 'log2', 'all', '0.5', '3')."""
+    if text is None or text.lower() in ('sqrt', 'log2', 'all'):
+        return text if text is None else text.lower()
+    return float(text) if '.' in text else int(text)
+
+class FeatureSampler:
+    """
+    Draws the random subset of candidate attributes scored at each node.
+    Every node gets its own generator seeded from (seed, node id), so a node's
+    subset does not depend on how much of the tree was grown before it.
+    """
+    def __init__(self, k, seed):
+        self.k = k
+        self.seed = seed
+
+    def sample(self, candidates, node_id):
+        if len(candidates) <= self.k:
+            return candidates
+        rng = np.random.default_rng([self.seed, node_id])
+        # Keep column order so ties still go to the first attribute
+        picked = np.sort(rng.choice(len(candidates), size=self.k, replace=False))
+        return [candidates[i] for i in picked]
+
 class Node:
-    def __init__(self, attr=None, threshold=None, depth=0, df=None, criterion_func=mutual_information, optimize='max'):
+    def __init__(self, attr=None, threshold=None, depth=0, data=None, rows=None, weights=None, criterion_func=mutual_information, optimize='max', stats=NULL_STATS, sampler=None, node_id=1):
         self.left = None
         self.right = None
         self.attr = attr # the attribute used for splitting
         self.threshold = threshold # the attribute value leading to this node
         self.compare_symbol = None
         self.depth = depth
-        self.df = df # the df at this node
+        self.data = data # the shared training data
+        self.rows = rows # indices of the training rows at this node
+        self.weights = weights # sample weight of every training row, shared by the tree
         self.criterion_func = criterion_func
         self.optimize = optimize
+        self.stats = stats # TrainingStats collecting instrumentation
+        self.sampler = sampler # FeatureSampler, or None to score every attribute
+        self.node_id = node_id # position in the tree: root 1, children 2i and 2i + 1
         self.counts = self.get_counts() # [# of 0 labels, # of 1 labels]
         self.vote = self.get_vote() # majority vote for the node
         self.chosen_attr = list()
 
+    @classmethod
+    def from_stats(cls, attr, threshold, depth, counts, compare_symbol=None):
+        """A finished node made from its split and label counts alone, without training data."""
+        node = cls.__new__(cls)
+        node.left = None
+        node.right = None
+        node.attr = attr
+        node.threshold = threshold
+        node.compare_symbol = compare_symbol
+        node.depth = depth
+        node.counts = [int(c) for c in counts]
+        node.vote = node.get_vote()
+        return node
+
     def get_counts(self):
-        print(self.df.shape)
-        return [(self.df.iloc[:, -1] == 0).sum(), (self.df.iloc[:, -1] == 1).sum()]
+        labels = self.data.y[self.rows]
+        weights = self.weights[self.rows]
+        return [int(weights[labels == 0].sum()), int(weights[labels == 1].sum())]
 
     def get_vote(self):
         return 0 if self.counts[0] > self.counts[1] else 1
 
+    def finish(self):
+        # Only the split and leaf statistics outlive training
+        del self.data, self.rows, self.weights, self.criterion_func, self.optimize, self.stats, self.sampler, self.node_id, self.chosen_attr
+
+    def make_child(self, attr, threshold, rows, compare_symbol):
+        child_id = 2 * self.node_id + (0 if compare_symbol == "<" else 1)
+        child = Node(attr, threshold, self.depth + 1, self.data, rows, self.weights, self.criterion_func,
+                     self.optimize, self.stats, self.sampler, child_id)
+        child.compare_symbol = compare_symbol
+        return child
+
     def get_best_attribute(self):
         func = self.criterion_func
         optimize = self.optimize
-        Y = self.df.iloc[:, -1].tolist()
-        best_attr = None
-        best_score = None
-        for (attr, X) in self.df.iloc[:, :-1].items():
-            if (attr in self.chosen_attr):
-                continue
-            score = func(X.tolist(), Y)
-            print(f"Attribute: {attr}, Score: {score}")
-            if best_score is None:
-                best_score = score
-                best_attr = attr
-            else:
-                if optimize == 'max' and score > best_score:
-                    best_score = score
-                    best_attr = attr
-                elif optimize == 'min' and score < best_score:
-                    best_score = score
-                    best_attr = attr
-        print("Chosen attribute:", best_attr)
-        return best_attr
+        candidates = [j for j, attr in enumerate(self.data.features) if attr not in self.chosen_attr]
+        if self.sampler is not None:
+            candidates = self.sampler.sample(candidates, self.node_id)
+        if not candidates:
+            return None
+        # Score every candidate attribute in one batched call
+        counts = contingency_counts(self.data.X[np.ix_(self.rows, candidates)], self.data.y[self.rows], self.weights[self.rows])
+        scores = func(counts)
+        # argmax/argmin keep the first attribute on ties
+        best = np.argmax(scores) if optimize == 'max' else np.argmin(scores)
+        return self.data.features[candidates[best]]
+
+    def attr_values(self, attr):
+        return self.data.X[self.rows, self.data.feature_index[attr]]
 
     def best_threshold(self, attr):
-        # Get sorted unique values for the attribute
-        unique_vals = sorted(self.df[attr].unique())
-        best_thresh = None
-        best_score = float('inf')
-        # Try candidate thresholds between each pair of unique values
-        for i in range(len(unique_vals) - 1):
-            # Candidate threshold is the midpoint between consecutive values
-            thresh = (unique_vals[i] + unique_vals[i+1]) / 2.0
-            df_left = self.df[self.df[attr] <= thresh]
-            df_right = self.df[self.df[attr] > thresh]
-            # Skip candidate thresholds that result in an empty split
-            if df_left.empty or df_right.empty:
-                continue
-            # Compute a splitting score (for instance, weighted Gini impurity)
-            score = self.compute_split_score(df_left, df_right)
-            if score < best_score:
-                best_score = score
-                best_thresh = thresh
-        return best_thresh, best_score
-
-    def compute_split_score(self, df_left, df_right):
-        # Here you can compute the weighted impurity of the split.
-        # This is just an example using Gini impurity.
-        def gini(df):
-            target = df.iloc[:, -1].tolist()
-            if len(target) == 0:
-                return 0
-            p = target.count(1) / len(target)
-            return 1 - p**2 - (1 - p)**2
-        n = len(self.df)
-        score = (len(df_left)/n) * gini(df_left) + (len(df_right)/n) * gini(df_right)
-        return score
+        bins = self.data.bins
+        if bins is not None:
+            weights = np.asarray(self.weights[self.rows], dtype=float)
+            thresholds, scores = bins.best_thresholds(self.data.feature_index[attr], self.rows, 0, 1, weights,
+                                                      weights * (self.data.y[self.rows] == 1))
+            if np.isnan(thresholds[0]):
+                return None, float('inf')
+            return float(thresholds[0]), float(scores[0])
+        # Score every candidate threshold for the attribute in one pass
+        thresholds, scores = threshold_scores(self.attr_values(attr), self.data.y[self.rows], self.weights[self.rows])
+        if len(thresholds) == 0:
+            return None, float('inf')
+        # argmin keeps the first (lowest) threshold on ties
+        best = np.argmin(scores)
+        return float(thresholds[best]), float(scores[best])
 
     # def split(self):
     #     attr = self.get_best_attribute()
@@ -147,33 +453,65 @@ class Node:
     #     df_1 = self.df[self.df[attr] == 1]
     #     return attr, df_0, df_1
     def split(self):
+        n_rows = len(self.rows)
         # First, choose the best attribute.
-        attr = self.get_best_attribute()
+        n_candidates = len(self.data.features) - len(self.chosen_attr)
+        if self.sampler is not None:
+            n_candidates = min(n_candidates, self.sampler.k)
+        with self.stats.phase("attribute_scoring", n_rows * n_candidates):
+            attr = self.get_best_attribute()
         if attr is None:
             return None  # No attribute available
 
         # Now, search for the best threshold for splitting on this attribute.
-        best_thresh, score = self.best_threshold(attr)
+        with self.stats.phase("threshold_search", n_rows):
+            best_thresh, score = self.best_threshold(attr)
         if best_thresh is None:
-            print(f"No valid split found for {attr}. Node becomes a leaf.")
             return None  # Signal that a valid split was not found
 
         # self.threshold = best_thresh  # store the found threshold
-        print(f"Splitting on {attr} with threshold {best_thresh}")
 
-        # Partition the data using the threshold.
-        df_left = self.df[self.df[attr] <= best_thresh]
-        df_right = self.df[self.df[attr] > best_thresh]
-        if df_left.empty or df_right.empty:
-            print(f"Empty split encountered for {attr} at threshold {best_thresh}. Node becomes a leaf.")
-            return None
+        # Partition the row indices using the threshold.
+        with self.stats.phase("partitioning", n_rows):
+            goes_left = self.attr_values(attr) <= best_thresh
+            rows_left = self.rows[goes_left]
+            rows_right = self.rows[~goes_left]
+        if len(rows_left) == 0 or len(rows_right) == 0:
+            return None  # Empty split; the node becomes a leaf
+
+        return attr, best_thresh, rows_left, rows_right
 
-        return attr, best_thresh, df_left, df_right
 
 
+BUILDERS = ('depthfirst', 'levelwise')
 
-def learn_tree(df, max_depth, criterion_func, optimize):
-    root = Node(None, None, 0, df, criterion_func, optimize)
+def learn_tree(data, max_depth, criterion_func, optimize, rows=None, stats=None, weights=None, max_features=None, seed=0, builder='depthfirst'):
+    """
+    Learn a tree from a DataFrame (label in the last column) or a TrainingData.
+    weights optionally gives an integer sample weight per training row, e.g.
+    how often a bootstrap sample drew it; rows with weight 0 are left out.
+    Alternatively rows lists the training row indices, duplicates allowed.
+    stats is an optional TrainingStats. max_features (see resolve_max_features)
+    limits each split to a random subset of the attributes, drawn from seed.
+    builder is 'depthfirst' (learn_node) or 'levelwise' (learn_levels); both
+    build the same tree.
+    """
+    if isinstance(data, pd.DataFrame):
+        data = TrainingData(data)
+    if weights is None:
+        if rows is None:
+            weights = np.ones(len(data), dtype=np.int32)
+        else:
+            weights = np.bincount(rows, minlength=len(data)).astype(np.int32)
+    if stats is None:
+        stats = NULL_STATS
+    k = resolve_max_features(max_features, len(data.features))
+    sampler = FeatureSampler(k, seed) if k < len(data.features) else None
+    if builder == 'levelwise':
+        return learn_levels(data, max_depth, criterion_func, optimize, weights, stats, sampler)
+    if builder != 'depthfirst':
+        raise ValueError("Unknown builder: " + str(builder))
+    root = Node(None, None, 0, data, np.flatnonzero(weights), weights, criterion_func, optimize, stats, sampler)
     learn_node(root, max_depth)
     return root
 
@@ -194,34 +532,205 @@ def learn_tree(df, max_depth, criterion_func, optimize):
 #     learn_node(node.left, max_depth)
 #     learn_node(node.right, max_depth)
 def learn_node(node, max_depth):
+    node.stats.node_built(node.depth)
     if node.depth >= max_depth:
-        print("Max depth reached at node with counts:", node.counts)
+        # Max depth reached; this node is a leaf.
+        node.stats.leaf_built()
+        node.finish()
         return
 
     # Try to split the node.
     result = node.split()
     if result is None:
         # No valid split was found; this node will remain a leaf.
-        print("No valid split; node becomes a leaf with counts:", node.counts)
+        node.stats.leaf_built()
+        node.finish()
         return
 
-    attr, threshold, df_left, df_right = result
+    attr, threshold, rows_left, rows_right = result
 
     # Update the node's splitting attribute (it will be valid now).
     # node.attr = attr
 
     # Create left and right child nodes using the split data.
-    node.left = Node(attr, threshold, node.depth + 1, df_left, node.criterion_func, node.optimize)
-    node.right = Node(attr, threshold, node.depth + 1, df_right, node.criterion_func, node.optimize)
-    node.left.compare_symbol = "<"
-    node.right.compare_symbol = ">"
+    node.left = node.make_child(attr, threshold, rows_left, "<")
+    node.right = node.make_child(attr, threshold, rows_right, ">")
     node.chosen_attr.append(attr)
     node.left.chosen_attr.extend(node.chosen_attr)
     node.right.chosen_attr.extend(node.chosen_attr)
+    node.finish()
     learn_node(node.left, max_depth)
     learn_node(node.right, max_depth)
 
 
+def learn_levels(data, max_depth, criterion_func, optimize, weights, stats=NULL_STATS, sampler=None):
+    """
+    Breadth-first alternative to learn_node: the tree grows one depth at a
+    time. Every training row keeps the slot of the open node it belongs to,
+    and each step scores all open nodes together with one grouped pass per
+    feature (bincount over node slot x value class x label). Splits, ties and
+    attribute subsets follow Node.split exactly, so the tree is the same as
+    the depth-first one; there is no recursion and no per-node row copy.
+    """
+    features = data.features
+    n_features = len(features)
+    rows = np.flatnonzero(weights)
+    slot = np.zeros(len(rows), dtype=np.int64)
+    labels = data.y[rows]
+    w = np.asarray(weights[rows], dtype=float)
+    w0 = w * (labels == 0)
+    w1 = w * (labels == 1)
+
+    root = Node.from_stats(None, None, 0, [w0.sum(), w1.sum()])
+    level = [root] # open nodes of the current depth, indexed by slot
+    node_ids = [1]
+    chosen = [[]] # attributes used by the ancestors of each open node
+    depth = 0
+    while level:
+        n_open = len(level)
+        for node in level:
+            stats.node_built(depth)
+        if depth >= max_depth:
+            for node in level:
+                stats.leaf_built()
+            break
+
+        candidates = np.zeros((n_open, n_features), dtype=bool)
+        for s in range(n_open):
+            allowed = [j for j, attr in enumerate(features) if attr not in chosen[s]]
+            if sampler is not None:
+                allowed = sampler.sample(allowed, node_ids[s])
+            candidates[s, allowed] = True
+
+        # Contingency tables of every open node and feature: (slot, feature, value class, label).
+        # Each feature only counts the rows of the nodes that sampled it.
+        scored = np.flatnonzero(candidates.any(axis=0))
+        node_rows = np.bincount(slot, minlength=n_open)
+        with stats.phase("attribute_scoring", int(node_rows @ candidates[:, scored].sum(axis=1))):
+            tables = np.zeros((n_open, len(scored), 3, 2))
+            for i, j in enumerate(scored):
+                keep = candidates[slot, j]
+                values = data.X[rows[keep], j]
+                key = slot[keep] * 3 + np.where(values == 0, 0, np.where(values == 1, 1, 2))
+                tables[:, i, :, 0] = np.bincount(key, weights=w0[keep], minlength=3 * n_open).reshape(n_open, 3)
+                tables[:, i, :, 1] = np.bincount(key, weights=w1[keep], minlength=3 * n_open).reshape(n_open, 3)
+            # Only the (node, feature) pairs that were sampled have tables to score
+            sampled = candidates[:, scored]
+            scored_scores = np.zeros((n_open, len(scored)))
+            scored_scores[sampled] = criterion_func(tables[sampled])
+            scores = np.zeros((n_open, n_features))
+            scores[:, scored] = scored_scores
+            # Non-candidates can never win; argmax/argmin keep the first attribute on ties
+            if optimize == 'max':
+                best_attr = np.argmax(np.where(candidates, scores, -np.inf), axis=1)
+            else:
+                best_attr = np.argmin(np.where(candidates, scores, np.inf), axis=1)
+            best_attr[~candidates.any(axis=1)] = -1
+
+        with stats.phase("threshold_search", len(rows)):
+            thresholds = np.full(n_open, np.nan)
+            for j in np.unique(best_attr[best_attr >= 0]):
+                if data.bins is not None:
+                    keep = (best_attr == j)[slot]
+                    found, _ = data.bins.best_thresholds(j, rows[keep], slot[keep], n_open, w[keep], w1[keep])
+                    thresholds[best_attr == j] = found[best_attr == j]
+                else:
+                    thresholds[best_attr == j] = level_thresholds(data.X[rows, j], slot, w, w1, best_attr == j)
+
+        with stats.phase("partitioning", len(rows)):
+            splits = ~np.isnan(thresholds)
+            active = splits[slot]
+            goes_left = np.zeros(len(rows), dtype=bool)
+            goes_left[active] = (data.X[rows[active], best_attr[slot[active]]] <= thresholds[slot[active]])
+            n_left = np.bincount(slot[goes_left], minlength=n_open)
+            n_right = np.bincount(slot[active & ~goes_left], minlength=n_open)
+            # Empty split; the node becomes a leaf
+            splits &= (n_left > 0) & (n_right > 0)
+            active = splits[slot]
+            # Children of the k-th splitting node get slots 2k and 2k + 1
+            child_slot = 2 * (np.cumsum(splits) - 1)[slot] + ~goes_left
+            rows, slot, w, w0, w1 = rows[active], child_slot[active], w[active], w0[active], w1[active]
+            n_children = 2 * int(splits.sum())
+            counts0 = np.bincount(slot, weights=w0, minlength=n_children)
+            counts1 = np.bincount(slot, weights=w1, minlength=n_children)
+
+        next_level, next_ids, next_chosen = [], [], []
+        for s, node in enumerate(level):
+            if not splits[s]:
+                stats.leaf_built()
+                continue
+            attr = features[best_attr[s]]
+            threshold = float(thresholds[s])
+            k = len(next_level)
+            node.left = Node.from_stats(attr, threshold, depth + 1, [counts0[k], counts1[k]], "<")
+            node.right = Node.from_stats(attr, threshold, depth + 1, [counts0[k + 1], counts1[k + 1]], ">")
+            next_level += [node.left, node.right]
+            next_ids += [2 * node_ids[s], 2 * node_ids[s] + 1]
+            next_chosen += [chosen[s] + [attr]] * 2
+        level, node_ids, chosen = next_level, next_ids, next_chosen
+        depth += 1
+    return root
+
+def level_thresholds(values, slot, weights, ones, nodes):
+    """
+    Best threshold on one feature for every open node selected by the boolean
+    mask nodes (NaN where no split exists), scored like threshold_scores: the
+    rows are sorted by (node, value) once and the cumulative counts restart at
+    every node.
+    """
+    keep = nodes[slot]
+    values, slot, weights, ones = values[keep], slot[keep], weights[keep], ones[keep]
+    order = np.lexsort((values, slot))
+    values, slot, weights, ones = values[order], slot[order], weights[order], ones[order]
+    # Groups of equal (node, value), in increasing value within each node
+    starts = np.ones(len(values), dtype=bool)
+    starts[1:] = (slot[1:] != slot[:-1]) | (values[1:] != values[:-1])
+    group = np.cumsum(starts) - 1
+    group_slot = slot[starts]
+    group_value = values[starts]
+    totals = np.bincount(group, weights=weights)
+    group_ones = np.bincount(group, weights=ones)
+    # Cumulative counts within each node: subtract what came before its first group
+    cum_totals = np.cumsum(totals)
+    cum_ones = np.cumsum(group_ones)
+    first = np.ones(len(group_slot), dtype=bool)
+    first[1:] = group_slot[1:] != group_slot[:-1]
+    node_of_group = np.cumsum(first) - 1
+    before_totals = (cum_totals - totals)[first][node_of_group]
+    before_ones = (cum_ones - group_ones)[first][node_of_group]
+    node_totals = np.bincount(node_of_group, weights=totals)[node_of_group]
+    node_ones = np.bincount(node_of_group, weights=group_ones)[node_of_group]
+    # Candidate g puts the groups of its node up to g on the left side
+    has_next = np.zeros(len(group_slot), dtype=bool)
+    has_next[:-1] = group_slot[1:] == group_slot[:-1]
+    candidate = np.flatnonzero(has_next)
+    scores = split_scores(cum_totals[candidate] - before_totals[candidate], cum_ones[candidate] - before_ones[candidate],
+                          node_totals[candidate], node_ones[candidate])
+    midpoints = (group_value[candidate] + group_value[candidate + 1]) / 2.0
+    # First minimum per node: sort by (node, score, position)
+    cand_slot = group_slot[candidate]
+    order = np.lexsort((candidate, scores, cand_slot))
+    best = np.ones(len(order), dtype=bool)
+    best[1:] = cand_slot[order][1:] != cand_slot[order][:-1]
+    thresholds = np.full(len(nodes), np.nan)
+    thresholds[cand_slot[order][best]] = midpoints[order][best]
+    return thresholds[nodes]
+
+def truncate_tree(node, max_depth):
+    """
+    Copy of a learned tree cut off at max_depth. Growth is greedy and a node's
+    split does not depend on max_depth, so this is the same tree learn_tree
+    would build with that max_depth from the same rows.
+    """
+    truncated = copy.copy(node)
+    if node.depth >= max_depth or node.left is None or node.right is None:
+        truncated.left = None
+        truncated.right = None
+    else:
+        truncated.left = truncate_tree(node.left, max_depth)
+        truncated.right = truncate_tree(node.right, max_depth)
+    return truncated
+
 """
 def print_tree(node, indent=""):
     if node is None:
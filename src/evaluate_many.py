@@ -0,0 +1,71 @@
+import argparse
+import glob
+import os
+import numpy as np
+from forest import combine_forests
+from test import compile_forest, load_dataset, load_subtrees, score_predictions, write_metrics, write_predictions
+
+
+def evaluate_many(model_files, train_df, test_df):
+    """
+    Score every model against the same in-memory datasets. All forests are
+    stacked into one, so each dataset is routed through every tree in a single
+    batched pass. Returns {model file: (train predictions, test predictions)}.
+    """
+    forests = [compile_forest(load_subtrees(model_file), train_df) for model_file in model_files]
+    combined, tree_slices = combine_forests(forests)
+    votes = {name: combined.tree_votes(combined.feature_matrix(df)) for name, df in (("train", train_df), ("test", test_df))}
+    predictions = {}
+    for model_file, forest, trees in zip(model_files, forests, tree_slices):
+        # Same majority rule as FlatForest.predict_batch
+        predictions[model_file] = tuple(
+            (2 * votes[name][trees].sum(axis=0, dtype=np.int64) >= forest.n_trees).astype(int)
+            for name in ("train", "test"))
+    return predictions
+
+
+def output_dir_for(model_file, model_root, output_root):
+    """Mirror the model's directory under output_root (train/gini/depth_1 -> test/gini/depth_1)."""
+    relative = os.path.relpath(os.path.dirname(os.path.abspath(model_file)), os.path.abspath(model_root))
+    return os.path.normpath(os.path.join(output_root, relative))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evaluate many forests against the same datasets in one pass")
+    parser.add_argument("train_input", type=str, help='Path to training input .tsv file')
+    parser.add_argument("test_input", type=str, help='Path to test input .tsv file')
+    parser.add_argument("models", nargs="+",
+                        help='Model files or glob patterns (e.g., "train/*/depth_*/forest.pkl")')
+    parser.add_argument("--model-root", type=str, default="train",
+                        help='Root directory of the models; their layout below it is mirrored in --out-root')
+    parser.add_argument("--out-root", type=str, default="test",
+                        help='Root directory for each model\'s metrics.txt and predictions.txt')
+    parser.add_argument("--summary", type=str, default=None,
+                        help='Path of the combined comparison table (default: <out-root>/summary.tsv)')
+    args = parser.parse_args()
+
+    model_files = sorted({path for pattern in args.models for path in (glob.glob(pattern) or [pattern])})
+    train_df = load_dataset(args.train_input)
+    test_df = load_dataset(args.test_input)
+
+    rows = []
+    for model_file, (train_pred, test_pred) in evaluate_many(model_files, train_df, test_df).items():
+        out_dir = output_dir_for(model_file, args.model_root, args.out_root)
+        os.makedirs(out_dir, exist_ok=True)
+        train_accuracy, train_f1 = score_predictions(train_df, train_pred)
+        test_accuracy, test_f1 = score_predictions(test_df, test_pred)
+        write_metrics(os.path.join(out_dir, "metrics.txt"), train_accuracy, train_f1, test_accuracy, test_f1)
+        write_predictions(test_df, test_pred, os.path.join(out_dir, "predictions.txt"))
+        rows.append((model_file, train_accuracy, train_f1, test_accuracy, test_f1))
+
+    # Best test F1 first
+    rows.sort(key=lambda row: (-row[4], -row[3], row[0]))
+    summary = args.summary or os.path.join(args.out_root, "summary.tsv")
+    os.makedirs(os.path.dirname(summary) or ".", exist_ok=True)
+    with open(summary, "w") as f:
+        f.write("Model\tTrain Accuracy\tTrain F1\tTest Accuracy\tTest F1\n")
+        f.writelines("%s\t%.4f\t%.4f\t%.4f\t%.4f\n" % row for row in rows)
+    width = max(len(row[0]) for row in rows)
+    print(f"{'Model':<{width}}  Train Acc  Train F1  Test Acc  Test F1")
+    for row in rows:
+        print(f"{row[0]:<{width}}  {row[1]:9.4f}  {row[2]:8.4f}  {row[3]:8.4f}  {row[4]:7.4f}")
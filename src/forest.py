@@ -0,0 +1,145 @@
+import numpy as np
+from decision_tree import Node
+
+
+class FlatForest:
+    """
+    Inference form of a trained forest. The nodes of all trees are stored in
+    preorder in flat NumPy arrays; node i splits on feature[i] at threshold[i]
+    (rows with value <= threshold go to left[i], the rest to right[i]).
+    Leaves have feature -1 and children -1. roots[t] is the root of tree t.
+    """
+    # Per-node arrays, in the order they are stored in a model file
+    ARRAYS = ("feature", "threshold", "left", "right", "vote", "counts", "depth", "roots")
+
+    def __init__(self, features, feature, threshold, left, right, vote, counts, depth, roots, criterion=None):
+        self.features = list(features)
+        self.criterion = criterion
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.vote = np.asarray(vote, dtype=np.int8)
+        self.counts = np.asarray(counts, dtype=np.int64).reshape(-1, 2)
+        self.depth = np.asarray(depth, dtype=np.int32)
+        self.roots = np.asarray(roots, dtype=np.int32)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def max_depth(self):
+        return int(self.depth.max()) if len(self.depth) else 0
+
+    def feature_matrix(self, df):
+        """Select the forest's features from a DataFrame, in forest order."""
+        return df[self.features].to_numpy(dtype=float)
+
+    def tree_votes(self, X, trees=None):
+        """
+        Route all rows through all trees at once, one level per step.
+        Returns an (n_trees, n_rows) array of leaf votes; trees optionally
+        selects (by index or slice) the trees to use.
+        """
+        X = np.asarray(X, dtype=float)
+        rows = np.arange(len(X))
+        roots = self.roots if trees is None else np.atleast_1d(self.roots[trees])
+        node = np.repeat(roots[:, None], len(X), axis=1)
+        for _ in range(self.max_depth):
+            feat = self.feature[node]
+            internal = feat >= 0
+            if not internal.any():
+                break
+            go_left = X[rows, np.where(internal, feat, 0)] <= self.threshold[node]
+            child = np.where(go_left, self.left[node], self.right[node])
+            node = np.where(internal, child, node)
+        return self.vote[node]
+
+    def predict_one(self, x):
+        """Majority vote for a single feature vector (in forest order), walking each tree directly."""
+        ones = 0
+        for root in self.roots:
+            node = root
+            while self.feature[node] >= 0:
+                node = self.left[node] if x[self.feature[node]] <= self.threshold[node] else self.right[node]
+            ones += int(self.vote[node])
+        return 1 if 2 * ones >= self.n_trees else 0
+
+    def predict_batch(self, X):
+        """Majority vote of the trees for every row (ties go to 1)."""
+        votes = self.tree_votes(X)
+        return (2 * votes.sum(axis=0, dtype=np.int64) >= self.n_trees).astype(int)
+
+
+def flatten_forest(subtrees, features, criterion=None):
+    """Flatten a list of trained Node trees into a FlatForest over features."""
+    features = list(features)
+    index = {attr: j for j, attr in enumerate(features)}
+    feature, threshold, left, right, vote, counts, depth, roots = [], [], [], [], [], [], [], []
+
+    def add(node):
+        i = len(feature)
+        feature.append(-1)
+        threshold.append(np.nan)
+        left.append(-1)
+        right.append(-1)
+        vote.append(node.vote)
+        counts.append(node.counts)
+        depth.append(node.depth)
+        if node.left is not None and node.right is not None:
+            # The split is recorded on the children (see learn_node)
+            feature[i] = index[node.left.attr]
+            threshold[i] = node.left.threshold
+            left[i] = add(node.left)
+            right[i] = add(node.right)
+        return i
+
+    for tree in subtrees:
+        roots.append(add(tree))
+    return FlatForest(features, feature, threshold, left, right, vote, counts, depth, roots, criterion)
+
+
+def unflatten_forest(forest):
+    """Rebuild the Node trees of a FlatForest (the inverse of flatten_forest)."""
+    def build(i, attr=None, threshold=None, compare_symbol=None):
+        node = Node.from_stats(attr, threshold, int(forest.depth[i]), forest.counts[i], compare_symbol)
+        if forest.feature[i] >= 0:
+            split_attr = forest.features[forest.feature[i]]
+            split_threshold = float(forest.threshold[i])
+            node.left = build(forest.left[i], split_attr, split_threshold, "<")
+            node.right = build(forest.right[i], split_attr, split_threshold, ">")
+        return node
+
+    return [build(root) for root in forest.roots]
+
+
+def combine_forests(forests):
+    """
+    Stack several FlatForests into one so a single tree_votes() call scores
+    all of them. Returns the combined forest and, for each input forest, the
+    slice of tree rows that belong to it.
+    """
+    features = []
+    for forest in forests:
+        features.extend(attr for attr in forest.features if attr not in features)
+    index = {attr: j for j, attr in enumerate(features)}
+    parts = {name: [] for name in FlatForest.ARRAYS}
+    tree_slices = []
+    node_offset = 0
+    tree_offset = 0
+    for forest in forests:
+        remap = np.array([index[attr] for attr in forest.features] + [-1], dtype=np.int32)
+        # feature -1 (leaf) maps to the trailing -1 entry
+        parts["feature"].append(remap[forest.feature])
+        for name in ("left", "right"):
+            children = getattr(forest, name)
+            parts[name].append(np.where(children >= 0, children + node_offset, -1))
+        parts["roots"].append(forest.roots + node_offset)
+        for name in ("threshold", "vote", "counts", "depth"):
+            parts[name].append(getattr(forest, name))
+        tree_slices.append(slice(tree_offset, tree_offset + forest.n_trees))
+        node_offset += len(forest.feature)
+        tree_offset += forest.n_trees
+    arrays = {name: np.concatenate(values) for name, values in parts.items()}
+    return FlatForest(features, **arrays), tree_slices
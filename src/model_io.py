@@ -0,0 +1,124 @@
+import argparse
+import pickle
+import numpy as np
+import pandas as pd
+import array_file
+from forest import FlatForest, flatten_forest
+
+# Forest model file: an array_file whose header holds the feature names, the
+# criterion and, for every node array, its dtype, shape and byte offset, so
+# the arrays can be memory-mapped in place.
+MAGIC = b"DTFOREST"
+VERSION = 1
+
+_DTYPES = {
+    "feature": "<i4",
+    "threshold": "<f8",
+    "left": "<i4",
+    "right": "<i4",
+    "vote": "<i1",
+    "counts": "<i8",
+    "depth": "<i4",
+    "roots": "<i4",
+}
+
+
+def save_forest(forest, file_name):
+    """Write a FlatForest in the binary model format."""
+    arrays = {name: np.ascontiguousarray(getattr(forest, name), dtype=_DTYPES[name]) for name in FlatForest.ARRAYS}
+    offsets, _ = array_file.array_offsets(arrays.values())
+    layout = {name: {"dtype": _DTYPES[name], "shape": list(array.shape), "offset": offset}
+              for (name, array), offset in zip(arrays.items(), offsets)}
+    header = {
+        "features": forest.features,
+        "criterion": forest.criterion,
+        "n_trees": forest.n_trees,
+        "max_depth": forest.max_depth,
+        "arrays": layout,
+    }
+    with open(file_name, "wb") as f:
+        array_file.write_arrays(f, MAGIC, VERSION, header, list(arrays.values()))
+
+
+def is_model_file(file_name):
+    return array_file.has_magic(file_name, MAGIC)
+
+
+def load_forest(file_name, mmap=True):
+    """
+    Open a model file as a FlatForest. With mmap=True the node arrays are
+    read-only views of the memory-mapped file: nothing is parsed or copied, and
+    processes opening the same file share its pages.
+    """
+    found = array_file.read_header(file_name, MAGIC)
+    if found is None:
+        raise ValueError(f"{file_name} is not a forest model file")
+    version, header, data_start = found
+    if version != VERSION:
+        raise ValueError(f"Unsupported model file version {version} in {file_name}")
+    raw = array_file.open_data(file_name, mmap)
+    arrays = {}
+    for name in FlatForest.ARRAYS:
+        spec = header["arrays"][name]
+        count = int(np.prod(spec["shape"]))
+        arrays[name] = array_file.view_array(raw, data_start + spec["offset"], spec["dtype"], count).reshape(spec["shape"])
+    return FlatForest(header["features"], criterion=header["criterion"], **arrays)
+
+
+def load_model(file_name):
+    """Load a forest from either a model file or a legacy pickle of Node trees."""
+    if is_model_file(file_name):
+        return load_forest(file_name)
+    with open(file_name, "rb") as f:
+        return pickle.load(f)
+
+
+def used_features(subtrees):
+    """Features split on by a list of Node trees, in the order the trees first use them."""
+    features = []
+    stack = list(reversed(subtrees))
+    while stack:
+        node = stack.pop()
+        if node.left is not None and node.left.attr not in features:
+            features.append(node.left.attr)
+        stack.extend(child for child in (node.right, node.left) if child is not None)
+    return features
+
+
+def load_flat(file_name, features=None):
+    """Load a model file, or a legacy pickle flattened over features (default: used_features)."""
+    model = load_model(file_name)
+    if isinstance(model, FlatForest):
+        return model
+    return flatten_forest(model, used_features(model) if features is None else features)
+
+
+def convert_pickle(pickle_file_name, model_file_name, features=None, criterion=None):
+    """
+    Convert a pickled list of Node trees to the model format. Without a
+    feature list the features are taken in the order the trees first use them.
+    """
+    with open(pickle_file_name, "rb") as f:
+        subtrees = pickle.load(f)
+    if features is None:
+        features = used_features(subtrees)
+    forest = flatten_forest(subtrees, features, criterion)
+    save_forest(forest, model_file_name)
+    return forest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert a pickled forest to the binary model format")
+    parser.add_argument("pickle_input", type=str, help='Path to the pickled forest (e.g., train/forest.pkl)')
+    parser.add_argument("model_output", type=str, help='Path to the output model file (e.g., train/forest.model)')
+    parser.add_argument("--schema", type=str, default=None,
+                        help='TSV file whose columns (all but the label) give the feature order')
+    parser.add_argument("--criterion", type=str, default=None,
+                        help='Criterion the forest was trained with, recorded in the header')
+    args = parser.parse_args()
+
+    features = None
+    if args.schema is not None:
+        features = list(pd.read_csv(args.schema, sep="\t", nrows=0).columns[:-1])
+    forest = convert_pickle(args.pickle_input, args.model_output, features, args.criterion)
+    print(f"Converted {forest.n_trees} trees ({len(forest.feature)} nodes) to {args.model_output}")
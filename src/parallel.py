@@ -0,0 +1,41 @@
+import os
+import numpy as np
+from decision_tree import FeatureBins, TrainingData
+
+# Training data of the current worker process, attached once by init_worker
+_worker_data = None
+
+
+def share_training_data(data, directory):
+    """
+    Write the feature matrix and labels (and the binned matrix, if any) as .npy
+    files in directory so worker processes can memory-map them instead of
+    receiving a pickled copy per task. Returns the arguments for init_worker.
+    """
+    paths = {}
+    arrays = [("X", data.X), ("y", data.y)]
+    if data.bins is not None:
+        arrays += [("bin_codes", data.bins.codes), ("bin_lower", data.bins.lower), ("bin_upper", data.bins.upper)]
+    for name, array in arrays:
+        paths[name] = os.path.join(directory, name + ".npy")
+        np.save(paths[name], np.ascontiguousarray(array))
+    return paths, data.columns
+
+
+def attach_training_data(paths, columns):
+    """Open shared training data read-only; pages are shared through the OS cache."""
+    X = np.load(paths["X"], mmap_mode="r")
+    y = np.load(paths["y"], mmap_mode="r")
+    bins = None
+    if "bin_codes" in paths:
+        bins = FeatureBins.from_arrays(*(np.load(paths[name], mmap_mode="r") for name in ("bin_codes", "bin_lower", "bin_upper")))
+    return TrainingData.from_arrays(X, y, columns, bins)
+
+
+def init_worker(paths, columns):
+    global _worker_data
+    _worker_data = attach_training_data(paths, columns)
+
+
+def worker_data():
+    return _worker_data
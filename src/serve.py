@@ -0,0 +1,306 @@
+import argparse
+import json
+import queue
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from model_io import load_flat
+
+
+class ModelHolder:
+    """
+    The model currently being served. reload() reads the model file again
+    (replace it, e.g. by renaming a new model over it, to deploy a new
+    forest) and loads it completely before swapping it in, so batches
+    already running finish on the old model and no request is dropped.
+    The file is fixed at start-up: legacy pickles can run arbitrary code
+    when loaded, so clients never get to choose what is loaded.
+    """
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.forest = load_flat(file_name)
+        self.loaded_at = time.time()
+        self.reloads = 0
+        self._lock = threading.Lock()
+
+    def reload(self):
+        with self._lock:
+            forest = load_flat(self.file_name)
+            self.forest = forest
+            self.loaded_at = time.time()
+            self.reloads += 1
+            return forest
+
+
+class ServerStats:
+    """Request, record and batch counters plus recent request latencies."""
+    def __init__(self, window=10000):
+        self.started = time.time()
+        self.requests = 0
+        self.records = 0
+        self.batches = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record_batch(self):
+        with self._lock:
+            self.batches += 1
+
+    def record_request(self, n_records, seconds, error=False):
+        with self._lock:
+            self.requests += 1
+            self.records += n_records
+            self.errors += int(error)
+            self.latencies.append(seconds)
+
+    def to_dict(self):
+        with self._lock:
+            latencies = np.array(self.latencies) * 1000.0
+            uptime = time.time() - self.started
+            summary = {
+                "uptime_seconds": uptime,
+                "requests": self.requests,
+                "records": self.records,
+                "batches": self.batches,
+                "errors": self.errors,
+                "records_per_second": self.records / uptime if uptime > 0 else 0.0,
+                "records_per_batch": self.records / self.batches if self.batches else 0.0,
+            }
+        if len(latencies):
+            summary.update({
+                "latency_ms_mean": float(latencies.mean()),
+                "latency_ms_p50": float(np.percentile(latencies, 50)),
+                "latency_ms_p99": float(np.percentile(latencies, 99)),
+                "latency_ms_max": float(latencies.max()),
+            })
+        return summary
+
+
+class Batcher:
+    """
+    Combines concurrent prediction requests into one vectorized batch. The
+    first waiting request opens a window of `window` seconds (or until
+    max_batch records are waiting); everything queued by then is predicted
+    together with a single predict_batch call.
+    """
+    def __init__(self, holder, stats, window=0.002, max_batch=4096):
+        self.holder = holder
+        self.stats = stats
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, X, features):
+        """Queue a matrix whose columns are features; the future resolves to its predictions."""
+        future = Future()
+        self._queue.put((X, features, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first):
+        pending = [first]
+        n_records = len(first[0])
+        deadline = time.monotonic() + self.window
+        while n_records < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                # Keep the stop signal for the main loop
+                self._queue.put(None)
+                break
+            pending.append(item)
+            n_records += len(item[0])
+        return pending
+
+    def _run(self):
+        # Only the stop signal ends this loop: any error fails the requests
+        # of its batch instead of the thread, which every request depends on
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            pending = [first]
+            try:
+                pending = self._collect(first)
+                self._predict(pending)
+            except Exception as e:
+                for _, _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _predict(self, pending):
+        # Take one model snapshot for the whole batch, so a reload in
+        # between cannot mix feature orders
+        forest = self.holder.forest
+        matrices = []
+        for X, features, future in pending:
+            try:
+                if features != forest.features:
+                    # Converted before a reload changed the feature order
+                    X = X[:, [features.index(name) for name in forest.features]]
+                matrices.append((X, future))
+            except ValueError:
+                future.set_exception(ValueError("The model was reloaded with different features; retry"))
+            except Exception as e:
+                future.set_exception(e)
+        if not matrices:
+            return
+        predictions = forest.predict_batch(np.concatenate([X for X, _ in matrices]))
+        self.stats.record_batch()
+        offset = 0
+        for X, future in matrices:
+            future.set_result(predictions[offset:offset + len(X)])
+            offset += len(X)
+
+
+def records_to_matrix(records, features):
+    """Turn a list of {feature: value} records into a matrix in forest order."""
+    try:
+        return np.array([[float(record[name]) for name in features] for record in records], dtype=float).reshape(-1, len(features))
+    except KeyError as e:
+        raise ValueError(f"Missing feature {e.args[0]}")
+    except (TypeError, ValueError, OverflowError) as e:
+        raise ValueError(f"Invalid feature value: {e}")
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """
+    POST /predict   a record, a list of records, or {"records": [...]}
+    GET  /stats     latency and throughput counters
+    GET  /health    model file and load time
+    POST /reload    reload the model file the server was started with
+    """
+    server_version = "ForestServer/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"null")
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.server.stats.to_dict())
+        elif self.path == "/health":
+            holder = self.server.holder
+            self._send_json(200, {"model": holder.file_name, "loaded_at": holder.loaded_at,
+                                  "reloads": holder.reloads, "trees": holder.forest.n_trees,
+                                  "features": holder.forest.features})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path == "/predict":
+            self._predict()
+        elif self.path == "/reload":
+            try:
+                payload = self._read_json() or {}
+                if payload.get("model", self.server.holder.file_name) != self.server.holder.file_name:
+                    self._send_json(403, {"error": "only the model file the server was started with can be reloaded"})
+                    return
+                forest = self.server.holder.reload()
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+                return
+            self._send_json(200, {"model": self.server.holder.file_name, "trees": forest.n_trees})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _predict(self):
+        start = time.perf_counter()
+        try:
+            payload = self._read_json()
+            single = isinstance(payload, dict) and "records" not in payload
+            records = [payload] if single else payload["records"] if isinstance(payload, dict) else payload
+            if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+                raise ValueError("Expected a record or a list of records")
+            # Bad input is rejected here, in the request's own thread
+            features = self.server.holder.forest.features
+            X = records_to_matrix(records, features)
+            future = self.server.batcher.submit(X, features)
+            predictions = future.result(timeout=self.server.result_timeout).tolist()
+        except (ValueError, TypeError, KeyError) as e:
+            self.server.stats.record_request(0, time.perf_counter() - start, error=True)
+            self._send_json(400, {"error": str(e)})
+            return
+        except FutureTimeout:
+            self.server.stats.record_request(0, time.perf_counter() - start, error=True)
+            self._send_json(503, {"error": "prediction timed out"})
+            return
+        except Exception as e:
+            self.server.stats.record_request(0, time.perf_counter() - start, error=True)
+            self._send_json(500, {"error": str(e)})
+            return
+        self.server.stats.record_request(len(records), time.perf_counter() - start)
+        self._send_json(200, {"prediction": predictions[0]} if single else {"predictions": predictions})
+
+
+class PredictionServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Bursts of concurrent clients are the point; the default backlog of 5 resets them
+    request_queue_size = 256
+
+
+def make_server(model_file, host="127.0.0.1", port=8765, window=0.002, max_batch=4096, verbose=False,
+                result_timeout=10.0):
+    server = PredictionServer((host, port), PredictionHandler)
+    server.verbose = verbose
+    # A request not answered by then gets a 503 instead of holding its thread
+    server.result_timeout = result_timeout
+    server.holder = ModelHolder(model_file)
+    server.stats = ServerStats()
+    server.batcher = Batcher(server.holder, server.stats, window, max_batch)
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve forest predictions over local HTTP")
+    parser.add_argument("model", type=str, help='Path to the forest model file (or legacy pickle)')
+    parser.add_argument("--host", type=str, default="127.0.0.1", help='Address to listen on')
+    parser.add_argument("--port", type=int, default=8765, help='Port to listen on')
+    parser.add_argument("--window-ms", type=float, default=2.0,
+                        help='How long the first request of a batch waits for others to join it')
+    parser.add_argument("--max-batch", type=int, default=4096, help='Maximum records per batch')
+    parser.add_argument("--timeout", type=float, default=10.0,
+                        help='Seconds a request waits for its batch before the server answers 503')
+    parser.add_argument("--verbose", action="store_true", help='Log every request')
+    args = parser.parse_args()
+
+    server = make_server(args.model, args.host, args.port, args.window_ms / 1000.0, args.max_batch, args.verbose,
+                         args.timeout)
+    # SIGHUP reloads the model file in place
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(target=server.holder.reload).start())
+    print(f"Serving {args.model} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.close()
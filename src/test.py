@@ -1,19 +1,22 @@
 import argparse
-import pandas as pd
-import pickle
+from collections import Counter
 import numpy as np
 from sklearn.metrics import accuracy_score, f1_score
+import dataset_cache
 import decision_tree
+from forest import FlatForest, flatten_forest
+from model_io import load_model
 
 def load_subtrees(file_name):
-    """Load the list of trees (the forest) from a pickle file."""
-    with open(file_name, "rb") as f:
-        subtrees = pickle.load(f)
-    return subtrees
+    """
+    Load the forest: a memory-mapped FlatForest from a model file, or the list
+    of trees from a legacy pickle file.
+    """
+    return load_model(file_name)
 
 def load_dataset(file_name):
-    """Read a TSV file into a DataFrame."""
-    return pd.read_csv(file_name, sep="\t")
+    """Read a TSV file into a DataFrame (from its columnar cache when up to date)."""
+    return dataset_cache.load_dataset(file_name)
 
 def predict_row(row, node):
     if node.left is None and node.right is None:
@@ -31,51 +34,141 @@ def predict_forest(row, subtrees):
     avg_vote = np.mean(votes)
     return 1 if avg_vote >= 0.5 else 0
 
-def evaluate_forest(subtrees, df):
-    """Evaluate the forest on a DataFrame. Returns accuracy and F1 score."""
-    predictions = []
-    actual = df.iloc[:, -1].tolist()
-    for _, row in df.iterrows():
-        pred = predict_forest(row, subtrees)
-        predictions.append(pred)
+def compile_forest(subtrees, df):
+    """Flatten a list of trees for batch prediction over the features of df."""
+    if isinstance(subtrees, FlatForest):
+        return subtrees
+    return flatten_forest(subtrees, df.columns[:-1])
+
+def score_predictions(df, predictions):
+    """Accuracy and macro F1 score of predictions against the labels of df."""
+    actual = df.iloc[:, -1].to_numpy()
     accuracy = accuracy_score(actual, predictions)
     f1 = f1_score(actual, predictions, average='macro')
     return accuracy, f1
 
-def output_predictions(subtrees, df, out_file):
+def evaluate_forest(subtrees, df):
+    """Evaluate the forest on a DataFrame. Returns accuracy and F1 score."""
+    forest = compile_forest(subtrees, df)
+    return score_predictions(df, forest.predict_batch(forest.feature_matrix(df)))
+
+def write_predictions(df, predictions, out_file):
     """
     Write a file with the index, actual label, and predicted label for each instance.
     """
+    # Labels are written with the row dtype iterrows() used to produce
+    actual = df.iloc[:, -1].to_numpy(dtype=np.result_type(*df.dtypes))
     with open(out_file, "w") as f:
         f.write("Index\tActual\tPredicted\n")
-        for idx, row in df.iterrows():
-            actual = row.iloc[-1]
-            predicted = predict_forest(row, subtrees)
-            f.write(f"{idx}\t{actual}\t{predicted}\n")
+        f.writelines(f"{idx}\t{a}\t{p}\n" for idx, a, p in zip(df.index, actual, predictions))
+
+def output_predictions(subtrees, df, out_file):
+    """
+    Write a file with the index, actual label, and predicted label for each instance.
+    """
+    forest = compile_forest(subtrees, df)
+    write_predictions(df, forest.predict_batch(forest.feature_matrix(df)), out_file)
+
+def write_metrics(out_file, train_accuracy, train_f1, test_accuracy, test_f1):
+    with open(out_file, "w") as f:
+        f.write("Train Accuracy: {}\n".format(train_accuracy))
+        f.write("Train F1 Score: {}\n".format(train_f1))
+        f.write("Test Accuracy: {}\n".format(test_accuracy))
+        f.write("Test F1 Score: {}\n".format(test_f1))
+
+class StreamingMetrics:
+    """
+    Accuracy and macro-F1 accumulated batch by batch from per-label counts, so
+    a single pass over the data is enough (same values as sklearn's
+    accuracy_score and f1_score(average='macro')).
+    """
+    def __init__(self):
+        self.n = 0
+        self.correct = 0
+        self.actual_counts = Counter()
+        self.predicted_counts = Counter()
+        self.true_positives = Counter()
+
+    def update(self, actual, predicted):
+        actual = np.asarray(actual)
+        predicted = np.asarray(predicted)
+        hits = actual == predicted
+        self.n += len(actual)
+        self.correct += int(hits.sum())
+        for counter, labels in ((self.actual_counts, actual), (self.predicted_counts, predicted), (self.true_positives, actual[hits])):
+            values, counts = np.unique(labels, return_counts=True)
+            counter.update(dict(zip(values.tolist(), counts.tolist())))
+
+    def accuracy(self):
+        return self.correct / self.n
+
+    def f1(self):
+        # Per label F1 = 2TP / (2TP + FP + FN) = 2TP / (# actual + # predicted)
+        labels = set(self.actual_counts) | set(self.predicted_counts)
+        scores = [2 * self.true_positives[label] / (self.actual_counts[label] + self.predicted_counts[label])
+                  for label in sorted(labels)]
+        return float(np.mean(scores))
+
+def stream_forest(subtrees, file_name, chunksize, out_file=None):
+    """
+    Score a TSV file in chunks of chunksize rows so memory stays bounded by the
+    chunk size. Each chunk is predicted in one batch; predictions are written
+    to out_file (if given) through a buffered writer as the chunks go by.
+    Returns accuracy and F1 score.
+    """
+    metrics = StreamingMetrics()
+    forest = None
+    label_dtype = None
+    f = open(out_file, "w", buffering=1 << 20) if out_file is not None else None
+    try:
+        if f is not None:
+            f.write("Index\tActual\tPredicted\n")
+        for chunk in dataset_cache.read_chunks(file_name, chunksize):
+            if forest is None:
+                forest = compile_forest(subtrees, chunk)
+                # Keep the label format of the first chunk for the whole file
+                label_dtype = np.result_type(*chunk.dtypes)
+            predictions = forest.predict_batch(forest.feature_matrix(chunk))
+            actual = chunk.iloc[:, -1].to_numpy()
+            metrics.update(actual, predictions)
+            if f is not None:
+                labels = actual.astype(label_dtype)
+                f.writelines(f"{idx}\t{a}\t{p}\n" for idx, a, p in zip(chunk.index, labels, predictions))
+    finally:
+        if f is not None:
+            f.close()
+    return metrics.accuracy(), metrics.f1()
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument("tree_input", type=str, help='Path to file containing the pickled forest')
+    parser.add_argument("tree_input", type=str, help='Path to the forest model file (or legacy pickle)')
     parser.add_argument("train_input", type=str, help='Path to training input .tsv file')
     parser.add_argument("test_input", type=str, help='Path to test input .tsv file')
     parser.add_argument("metrics_out", type=str, help='Path to output .txt file for evaluation metrics')
     parser.add_argument("predictions_out", type=str, help='Path to output .txt file for predictions vs actual')
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help='Stream the input files in chunks of this many rows instead of loading them whole')
     args = parser.parse_args()
 
     # load the saved forest (list of subtrees)
     subtrees = load_subtrees(args.tree_input)
-    # load the datasets
-    train_df = load_dataset(args.train_input)
-    test_df = load_dataset(args.test_input)
 
-    # evaluate on both training and testing data
-    train_accuracy, train_f1 = evaluate_forest(subtrees, train_df)
-    test_accuracy, test_f1 = evaluate_forest(subtrees, test_df)
+    if args.chunksize:
+        # single pass per file: metrics and predictions come out of the same scan
+        train_accuracy, train_f1 = stream_forest(subtrees, args.train_input, args.chunksize)
+        test_accuracy, test_f1 = stream_forest(subtrees, args.test_input, args.chunksize, args.predictions_out)
+    else:
+        # load the datasets
+        train_df = load_dataset(args.train_input)
+        test_df = load_dataset(args.test_input)
+        # flatten the forest once for batch prediction
+        subtrees = compile_forest(subtrees, train_df)
 
-    with open(args.metrics_out, "w") as f:
-        f.write("Train Accuracy: {}\n".format(train_accuracy))
-        f.write("Train F1 Score: {}\n".format(train_f1))
-        f.write("Test Accuracy: {}\n".format(test_accuracy))
-        f.write("Test F1 Score: {}\n".format(test_f1))
+        # evaluate on both training and testing data
+        train_accuracy, train_f1 = evaluate_forest(subtrees, train_df)
+        test_accuracy, test_f1 = evaluate_forest(subtrees, test_df)
+
+    write_metrics(args.metrics_out, train_accuracy, train_f1, test_accuracy, test_f1)
 
-    output_predictions(subtrees, test_df, args.predictions_out)
\ No newline at end of file
+    if not args.chunksize:
+        output_predictions(subtrees, test_df, args.predictions_out)
\ No newline at end of file
@@ -0,0 +1,42 @@
+"""
+Check that every trained grid forest (train/*/depth_*/forest.pkl) compiled
+by codegen.py predicts exactly like the interpreted forest on data/test.tsv.
+Run with pytest or as a script: python src/test_codegen.py
+"""
+import glob
+import os
+import tempfile
+from codegen import load_module, verify_module, write_module
+from forest import flatten_forest
+from model_io import load_model
+from test import load_dataset
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def compiled_mismatches():
+    """(model file, mismatching rows) for every grid forest."""
+    schema = load_dataset(os.path.join(ROOT, "data", "train.tsv")).columns[:-1]
+    df = load_dataset(os.path.join(ROOT, "data", "test.tsv"))
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for k, model_file in enumerate(sorted(glob.glob(os.path.join(ROOT, "train", "*", "depth_*", "forest.pkl")))):
+            model = load_model(model_file)
+            module_file = os.path.join(directory, f"forest_{k}.py")
+            write_module(flatten_forest(model, schema), module_file, model_file)
+            results.append((model_file, verify_module(load_module(module_file), model, df)))
+    return results
+
+
+def test_compiled_forests_match_interpreted():
+    results = compiled_mismatches()
+    assert results, "no trained forests found under train/"
+    assert all(mismatches == 0 for _, mismatches in results), results
+
+
+if __name__ == '__main__':
+    results = compiled_mismatches()
+    for model_file, mismatches in results:
+        print(f"{os.path.relpath(model_file, ROOT)}: {mismatches} mismatching rows")
+    if not results or any(mismatches for _, mismatches in results):
+        raise SystemExit(1)
@@ -1,34 +1,146 @@
 import argparse
-import pandas as pd
+import json
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import numpy as np
 import pickle
-from decision_tree import learn_tree, print_tree, parse_criterion
+from sklearn.metrics import accuracy_score, f1_score
+from decision_tree import BUILDERS, FeatureBins, TrainingData, TrainingStats, learn_tree, print_tree, parse_criterion, parse_max_features
+import dataset_cache
+import parallel
+from forest import flatten_forest
+from model_io import save_forest
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
 
 def load_dataset(file_name):
-    df = pd.read_csv(file_name, sep="\t")
+    # From the columnar cache next to the TSV when it is up to date
+    df = dataset_cache.load_dataset(file_name)
     return df
 
-def train_subtree(data, max_depth, criterion):
+def train_subtree(data, weights, max_depth, criterion, stats=None, max_features=None, seed=0, builder='depthfirst'):
     criterion_func, optimize = criterion
-    return learn_tree(data, max_depth, criterion_func, optimize)
+    return learn_tree(data, max_depth, criterion_func, optimize, stats=stats, weights=weights,
+                      max_features=max_features, seed=seed, builder=builder)
+
+def create_bootstrap_sample(n_rows, seed):
+    # A bootstrap sample (sampling with replacement) as the number of times each
+    # row was drawn, rather than a copy of the drawn rows. Rows drawn 0 times
+    # are the tree's out-of-bag rows.
+    # Same draws as df.sample(n=n_rows, replace=True, random_state=seed).
+    draws = np.random.RandomState(seed).choice(n_rows, size=n_rows, replace=True)
+    return np.bincount(draws, minlength=n_rows).astype(np.int32)
+
+class OutOfBagVotes:
+    """
+    Out-of-bag votes collected while the forest is trained: every row is
+    scored only by the trees whose bootstrap sample did not draw it.
+    """
+    def __init__(self, n_rows):
+        self.ones = np.zeros(n_rows, dtype=np.int64) # trees voting 1 for the row
+        self.trees = np.zeros(n_rows, dtype=np.int64) # trees for which the row is out of bag
+
+    def add(self, rows, votes):
+        self.ones[rows] += votes
+        self.trees[rows] += 1
+
+    def scores(self, labels):
+        """Accuracy, macro F1 and number of rows with at least one out-of-bag tree."""
+        covered = self.trees > 0
+        if not covered.any():
+            return None, None, 0
+        # Same majority rule as the forest (ties go to 1)
+        predictions = (2 * self.ones[covered] >= self.trees[covered]).astype(int)
+        actual = np.asarray(labels)[covered]
+        return accuracy_score(actual, predictions), f1_score(actual, predictions, average='macro'), int(covered.sum())
+
+def tree_oob_votes(data, tree, weights):
+    """Votes of one tree for its out-of-bag rows (weight 0): (rows, votes)."""
+    rows = np.flatnonzero(weights == 0)
+    votes = flatten_forest([tree], data.features).tree_votes(data.X[rows])[0]
+    return rows, votes
 
-def create_bootstrap_sample(df, seed):
-    # Create a bootstrap sample from the full training data (sampling with replacement)
-    return df.sample(n=len(df), replace=True, random_state=seed)
+def train_seeded_subtree(data, seed, max_depth, criterion, stats=None, oob=False, max_features=None, builder='depthfirst'):
+    """
+    Train the tree of one seed, which drives both its bootstrap sample and its
+    per-node attribute subsets; with oob=True also return its out-of-bag votes.
+    """
+    weights = create_bootstrap_sample(len(data), seed)
+    tree = train_subtree(data, weights, max_depth, criterion, stats, max_features, seed, builder)
+    if oob:
+        return tree, tree_oob_votes(data, tree, weights)
+    return tree
 
-def write_subtrees_to_file(subtrees, text_file_name, pickle_file_name):
+def _train_worker(seed, max_depth, criterion, collect_stats=False, collect_oob=False, max_features=None, builder='depthfirst'):
+    stats = TrainingStats() if collect_stats else None
+    result = train_seeded_subtree(parallel.worker_data(), seed, max_depth, criterion, stats, collect_oob, max_features,
+                                  builder)
+    tree, oob_votes = result if collect_oob else (result, None)
+    return tree, stats, oob_votes
+
+def train_forest(data, max_depth, criterion, n_trees=3, jobs=1, stats=None, oob=None, max_features=None, builder='depthfirst'):
+    """
+    Train n_trees bootstrap trees (seeds 42, 43, ...), each split choosing among
+    max_features random attributes (all by default). With jobs > 1 the trees
+    are trained in worker processes that memory-map the training data; every
+    tree only depends on its seed, so the forest is the same as a serial run.
+    If stats (a TrainingStats) is given, it collects the statistics of all trees;
+    if oob (an OutOfBagVotes) is given, it collects every tree's out-of-bag votes.
+    builder selects the tree learner (see learn_tree); the trees are the same.
+    """
+    seeds = [42 + i for i in range(n_trees)]
+    if jobs <= 1:
+        results = []
+        for seed in seeds:
+            result = train_seeded_subtree(data, seed, max_depth, criterion, stats, oob is not None, max_features,
+                                          builder)
+            results.append((result, None, None) if oob is None else (result[0], None, result[1]))
+    else:
+        with tempfile.TemporaryDirectory() as shared_dir:
+            init_args = parallel.share_training_data(data, shared_dir)
+            with ProcessPoolExecutor(max_workers=jobs, initializer=parallel.init_worker, initargs=init_args) as pool:
+                worker = partial(_train_worker, max_depth=max_depth, criterion=criterion,
+                                 collect_stats=stats is not None, collect_oob=oob is not None,
+                                 max_features=max_features, builder=builder)
+                results = list(pool.map(worker, seeds))
+        if stats is not None:
+            for _, tree_stats, _ in results:
+                stats.merge(tree_stats)
+    if oob is not None:
+        for _, _, (rows, votes) in results:
+            oob.add(rows, votes)
+    return [tree for tree, _, _ in results]
+
+def peak_memory_kb():
+    """Peak resident set size of this process and its finished workers, in KB."""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+def write_subtrees_to_file(subtrees, text_file_name, model_file_name, features=None, criterion=None):
     # Write the text representation to a text file.
     # Open the text file in write mode to truncate it first.
     with open(text_file_name, "w") as f:
         for tree in subtrees:
             print_tree(tree, text_file_name)
-    # Write the full forest as a pickle file (binary mode).
-    with open(pickle_file_name, "wb") as f:
-        pickle.dump(subtrees, f)
+    if model_file_name.endswith(".pkl"):
+        # Legacy format: the forest as a pickle of Node objects (binary mode).
+        with open(model_file_name, "wb") as f:
+            pickle.dump(subtrees, f)
+    else:
+        # Binary model format (see model_io.py), memory-mappable at load time.
+        save_forest(flatten_forest(subtrees, features, criterion), model_file_name)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
-        description="Train a random forest of 3 trees using bootstrap sampling"
+        description="Train a random forest (3 trees by default) using bootstrap sampling"
     )
     # Use a single training file (created from your cleaned dataset)
     parser.add_argument("train_input", type=str,
@@ -39,22 +151,78 @@ if __name__ == '__main__':
                         help='Splitting criterion (mutual_information, gini, or lowest_variance)')
     parser.add_argument("tree_text_out", type=str,
                         help='Path to output text file for the forest (e.g., train/forest.txt)')
-    parser.add_argument("tree_pickle_out", type=str,
-                        help='Path to output pickle file for the forest (e.g., train/forest.pkl)')
+    parser.add_argument("tree_model_out", type=str,
+                        help='Path to output model file for the forest (e.g., train/forest.model); '
+                             'a .pkl path writes the legacy pickle instead')
+    parser.add_argument("--n-estimators", type=int, default=3,
+                        help='Number of trees in the forest')
+    parser.add_argument("--max-features", type=str, default=None,
+                        help='Attributes considered per split: an integer, a fraction (e.g. 0.5), sqrt, log2 or all (default)')
+    parser.add_argument("--jobs", type=int, default=1,
+                        help='Number of worker processes used to train the trees in parallel')
+    parser.add_argument("--builder", choices=BUILDERS, default="depthfirst",
+                        help='Grow trees node by node (depthfirst) or one depth at a time over all open nodes (levelwise)')
+    parser.add_argument("--bins", type=int, default=None,
+                        help='Search thresholds on histograms of this many quantile bins per feature (at most 256)')
+    parser.add_argument("--stats-out", type=str, default=None,
+                        help='Write a JSON summary of timings, nodes per depth, rows scanned and peak memory')
+    parser.add_argument("--oob", action="store_true",
+                        help='Report out-of-bag accuracy and F1 score computed while training')
+    parser.add_argument("--oob-out", type=str, default=None,
+                        help='Write the out-of-bag metrics to this file (implies --oob)')
     args = parser.parse_args()
+    stats = TrainingStats() if args.stats_out else None
+    timings = {}
+    start = time.perf_counter()
 
     # Parse the splitting criterion using your shared module.
     criterion = parse_criterion(args.criterion)
 
-    # Load the training dataset.
-    train_df = load_dataset(args.train_input)
+    # Load the training dataset; every tree shares the same feature matrix.
+    train_data = TrainingData(load_dataset(args.train_input))
+    if args.bins:
+        # Bin edges and the binned matrix are computed once and shared by every tree.
+        train_data.bins = FeatureBins(train_data.X, args.bins)
+    timings["load_seconds"] = time.perf_counter() - start
+
+    # Build a random forest of n_estimators trees using bootstrap sampling.
+    oob = OutOfBagVotes(len(train_data)) if args.oob or args.oob_out else None
+    subtrees = train_forest(train_data, args.max_depth, criterion, n_trees=args.n_estimators, jobs=args.jobs,
+                            stats=stats, oob=oob, max_features=parse_max_features(args.max_features),
+                            builder=args.builder)
+    timings["train_seconds"] = time.perf_counter() - start - timings["load_seconds"]
+
+    if oob is not None:
+        oob_accuracy, oob_f1, oob_rows = oob.scores(train_data.y)
+        oob_report = ("OOB Accuracy: {}\n".format(oob_accuracy) +
+                      "OOB F1 Score: {}\n".format(oob_f1) +
+                      "OOB Rows: {}/{}\n".format(oob_rows, len(train_data)))
+        print(oob_report, end="")
+        if args.oob_out:
+            with open(args.oob_out, "w") as f:
+                f.write(oob_report)
 
-    # Build a random forest of 3 trees using bootstrap sampling.
-    subtrees = []
-    for i in range(3):
-        sample = create_bootstrap_sample(train_df, seed=42 + i)
-        tree = train_subtree(sample, args.max_depth, criterion)
-        subtrees.append(tree)
+    # Write both the text version and the model file of the forest.
+    write_subtrees_to_file(subtrees, args.tree_text_out, args.tree_model_out,
+                           train_data.features, args.criterion.lower())
+    timings["total_seconds"] = time.perf_counter() - start
 
-    # Write both the text version and the pickle file of the forest.
-    write_subtrees_to_file(subtrees, args.tree_text_out, args.tree_pickle_out)
+    if stats is not None:
+        summary = {
+            "train_input": args.train_input,
+            "criterion": args.criterion.lower(),
+            "max_depth": args.max_depth,
+            "n_trees": len(subtrees),
+            "max_features": args.max_features,
+            "jobs": args.jobs,
+            "builder": args.builder,
+            "bins": args.bins,
+            "rows": len(train_data),
+            "features": len(train_data.features),
+            **timings,
+            **stats.to_dict(),
+            **({"oob_accuracy": oob_accuracy, "oob_f1": oob_f1, "oob_rows": oob_rows} if oob is not None else {}),
+            "peak_memory_kb": peak_memory_kb(),
+        }
+        with open(args.stats_out, "w") as f:
+            json.dump(summary, f, indent=2)
@@ -0,0 +1,64 @@
+import argparse
+import os
+from decision_tree import BUILDERS, FeatureBins, TrainingData, parse_criterion, parse_max_features, truncate_tree
+from train import load_dataset, train_forest, write_subtrees_to_file
+
+CRITERIA = ["gini", "mutual_information", "lowest_variance"]
+
+
+def train_grid(train_data, criteria, depths, out_dir, model_name, n_trees=3, jobs=1, max_features=None,
+               builder='depthfirst'):
+    """
+    Train one forest per criterion at the largest requested depth and write
+    the truncated forest for every depth to out_dir/<criterion>/depth_<d>/.
+    Returns the written model paths.
+    """
+    written = []
+    for criterion in criteria:
+        subtrees = train_forest(train_data, max(depths), parse_criterion(criterion), n_trees=n_trees, jobs=jobs,
+                                max_features=max_features, builder=builder)
+        for depth in sorted(set(depths)):
+            depth_dir = os.path.join(out_dir, criterion, f"depth_{depth}")
+            os.makedirs(depth_dir, exist_ok=True)
+            model_file = os.path.join(depth_dir, model_name)
+            write_subtrees_to_file([truncate_tree(tree, depth) for tree in subtrees],
+                                   os.path.join(depth_dir, "forest.txt"), model_file,
+                                   train_data.features, criterion)
+            written.append(model_file)
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Train the criterion x depth grid, growing each forest once to the largest depth"
+    )
+    parser.add_argument("train_input", type=str,
+                        help='Path to training input TSV file (e.g., data/train.tsv)')
+    parser.add_argument("--criteria", nargs="+", default=CRITERIA,
+                        help='Splitting criteria to train (default: all three)')
+    parser.add_argument("--depths", type=int, nargs="+", default=list(range(1, 7)),
+                        help='Maximum depths to write (default: 1 to 6)')
+    parser.add_argument("--out-dir", type=str, default="train",
+                        help='Root directory; forests go to <out-dir>/<criterion>/depth_<d>/')
+    parser.add_argument("--model-name", type=str, default="forest.pkl",
+                        help='File name of each model file (a .pkl name writes the legacy pickle)')
+    parser.add_argument("--n-estimators", type=int, default=3,
+                        help='Number of trees in each forest')
+    parser.add_argument("--max-features", type=str, default=None,
+                        help='Attributes considered per split: an integer, a fraction, sqrt, log2 or all (default)')
+    parser.add_argument("--jobs", type=int, default=1,
+                        help='Number of worker processes used to train the trees in parallel')
+    parser.add_argument("--builder", choices=BUILDERS, default="depthfirst",
+                        help='Tree learner: depthfirst or levelwise (both build the same trees)')
+    parser.add_argument("--bins", type=int, default=None,
+                        help='Search thresholds on histograms of this many quantile bins per feature (at most 256)')
+    args = parser.parse_args()
+
+    train_data = TrainingData(load_dataset(args.train_input))
+    if args.bins:
+        train_data.bins = FeatureBins(train_data.X, args.bins)
+    criteria = [criterion.lower() for criterion in args.criteria]
+    for model_file in train_grid(train_data, criteria, args.depths, args.out_dir, args.model_name,
+                                 args.n_estimators, args.jobs, parse_max_features(args.max_features),
+                                 args.builder):
+        print(model_file)
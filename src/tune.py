@@ -0,0 +1,180 @@
+import argparse
+import itertools
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.model_selection import StratifiedKFold
+from decision_tree import BUILDERS, FeatureBins, TrainingData, parse_criterion, parse_max_features
+import parallel
+from forest import flatten_forest
+from train import create_bootstrap_sample, load_dataset, train_subtree
+
+CRITERIA = ["gini", "mutual_information", "lowest_variance"]
+
+# Fold row indices of the current worker process, attached once by init_worker
+_worker_folds = None
+
+
+def make_folds(labels, k, seed=0):
+    """Stratified k-fold split as a list of (train rows, test rows), each sorted."""
+    splitter = StratifiedKFold(n_splits=k, shuffle=True, random_state=seed)
+    return [(np.sort(train), np.sort(test)) for train, test in splitter.split(np.zeros(len(labels)), labels)]
+
+
+def fold_bins(X, train_rows, n_bins):
+    """
+    FeatureBins of the full matrix with bin edges from the fold's training
+    rows only, as train.py --bins computes them on a file of those rows; the
+    held-out rows (weight 0 in training) keep code 0.
+    """
+    bins = FeatureBins(X[train_rows], n_bins)
+    codes = np.zeros(X.shape, dtype=np.uint8)
+    codes[train_rows] = bins.codes
+    return FeatureBins.from_arrays(codes, bins.lower, bins.upper)
+
+
+def share_folds(folds, directory):
+    """
+    Write the fold row indices (and bins, if any) as .npy files next to the
+    shared training data.
+    """
+    paths = []
+    for k, (train_rows, test_rows, bins) in enumerate(folds):
+        arrays = [("train", train_rows), ("test", test_rows)]
+        if bins is not None:
+            arrays += [("bin_codes", bins.codes), ("bin_lower", bins.lower), ("bin_upper", bins.upper)]
+        fold = {}
+        for name, array in arrays:
+            fold[name] = os.path.join(directory, f"fold{k}_{name}.npy")
+            np.save(fold[name], array)
+        paths.append(fold)
+    return paths
+
+
+def init_worker(paths, columns, fold_paths):
+    global _worker_folds
+    parallel.init_worker(paths, columns)
+    _worker_folds = []
+    for fold in fold_paths:
+        train_rows, test_rows = (np.load(fold[name], mmap_mode="r") for name in ("train", "test"))
+        bins = None
+        if "bin_codes" in fold:
+            bins = FeatureBins.from_arrays(*(np.load(fold[name], mmap_mode="r")
+                                             for name in ("bin_codes", "bin_lower", "bin_upper")))
+        _worker_folds.append((train_rows, test_rows, bins))
+
+
+def evaluate_config(data, folds, criterion, max_depth, n_trees, fold, max_features=None, builder='depthfirst'):
+    """
+    Train one configuration on the training rows of a fold and score it on the
+    fold's test rows. The trees are learned on the shared feature matrix with
+    weight 0 outside the fold, so nothing is copied; with bins, the fold's
+    own bins are used. Returns (accuracy, macro F1, training seconds).
+    """
+    train_rows, test_rows, bins = folds[fold]
+    if bins is not None:
+        data = TrainingData.from_arrays(data.X, data.y, data.columns, bins)
+    start = time.perf_counter()
+    trees = []
+    for seed in range(42, 42 + n_trees):
+        # Same bootstrap sample as train.py on a file holding only the fold's training rows
+        weights = np.zeros(len(data), dtype=np.int32)
+        weights[train_rows] = create_bootstrap_sample(len(train_rows), seed)
+        trees.append(train_subtree(data, weights, max_depth, parse_criterion(criterion),
+                                   max_features=max_features, seed=seed, builder=builder))
+    train_seconds = time.perf_counter() - start
+    predictions = flatten_forest(trees, data.features).predict_batch(data.X[test_rows])
+    actual = data.y[test_rows]
+    return accuracy_score(actual, predictions), f1_score(actual, predictions, average='macro'), train_seconds
+
+
+def _evaluate_worker(task, max_features=None, builder='depthfirst'):
+    return evaluate_config(parallel.worker_data(), _worker_folds, *task, max_features=max_features, builder=builder)
+
+
+def cross_validate(data, configs, k=5, seed=0, jobs=1, max_features=None, builder='depthfirst', n_bins=None):
+    """
+    k-fold cross-validation of every (criterion, max_depth, n_trees) in configs.
+    With n_bins, thresholds are searched on histograms binned per fold, so
+    the held-out rows never shape the bins. Every (configuration, fold) pair
+    is one task; with jobs > 1 they run in worker processes that memory-map
+    the feature matrix, the labels and the fold indices and bins. Returns one
+    result dict per configuration.
+    """
+    folds = [(train_rows, test_rows, fold_bins(data.X, train_rows, n_bins) if n_bins else None)
+             for train_rows, test_rows in make_folds(data.y, k, seed)]
+    tasks = [config + (fold,) for config in configs for fold in range(k)]
+    if jobs <= 1:
+        scores = [evaluate_config(data, folds, *task, max_features=max_features, builder=builder) for task in tasks]
+    else:
+        with tempfile.TemporaryDirectory() as shared_dir:
+            paths, columns = parallel.share_training_data(data, shared_dir)
+            fold_paths = share_folds(folds, shared_dir)
+            with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                     initargs=(paths, columns, fold_paths)) as pool:
+                scores = list(pool.map(_evaluate_worker, tasks, itertools.repeat(max_features, len(tasks)),
+                                       itertools.repeat(builder, len(tasks))))
+    results = []
+    for i, (criterion, max_depth, n_trees) in enumerate(configs):
+        accuracy, f1, seconds = np.array(scores[i * k:(i + 1) * k]).T
+        results.append({
+            "criterion": criterion,
+            "max_depth": max_depth,
+            "n_trees": n_trees,
+            "accuracy_mean": accuracy.mean(),
+            "accuracy_std": accuracy.std(),
+            "f1_mean": f1.mean(),
+            "f1_std": f1.std(),
+            "train_seconds": seconds.mean(),
+        })
+    # Best mean F1 first; cheaper configurations win ties
+    results.sort(key=lambda r: (-r["f1_mean"], -r["accuracy_mean"], r["train_seconds"]))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Rank (criterion, max_depth, n_trees) configurations by k-fold cross-validation"
+    )
+    parser.add_argument("train_input", type=str,
+                        help='Path to training input TSV file (e.g., data/train.tsv)')
+    parser.add_argument("--criteria", nargs="+", default=CRITERIA, help='Splitting criteria to try')
+    parser.add_argument("--depths", type=int, nargs="+", default=list(range(1, 7)), help='Maximum depths to try')
+    parser.add_argument("--n-estimators", type=int, nargs="+", default=[3], help='Forest sizes to try')
+    parser.add_argument("--folds", type=int, default=5, help='Number of cross-validation folds')
+    parser.add_argument("--seed", type=int, default=0, help='Seed of the fold assignment')
+    parser.add_argument("--max-features", type=str, default=None,
+                        help='Attributes considered per split: an integer, a fraction, sqrt, log2 or all (default)')
+    parser.add_argument("--builder", choices=BUILDERS, default="depthfirst", help='Tree learner')
+    parser.add_argument("--bins", type=int, default=None,
+                        help='Search thresholds on histograms of this many quantile bins per feature '
+                             '(binned on each fold\'s training rows)')
+    parser.add_argument("--jobs", type=int, default=1,
+                        help='Number of worker processes; every (configuration, fold) pair is one task')
+    parser.add_argument("--out", type=str, default=None, help='Also write the ranked table to this TSV file')
+    args = parser.parse_args()
+
+    train_data = TrainingData(load_dataset(args.train_input))
+    configs = [(criterion.lower(), depth, n_trees)
+               for criterion in args.criteria for depth in args.depths for n_trees in args.n_estimators]
+    start = time.perf_counter()
+    results = cross_validate(train_data, configs, args.folds, args.seed, args.jobs,
+                             parse_max_features(args.max_features), args.builder, args.bins)
+    elapsed = time.perf_counter() - start
+
+    columns = ["criterion", "max_depth", "n_trees", "f1_mean", "f1_std", "accuracy_mean", "accuracy_std", "train_seconds"]
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            f.write("Rank\t" + "\t".join(columns) + "\n")
+            for rank, r in enumerate(results, 1):
+                f.write(f"{rank}\t" + "\t".join(str(r[name]) for name in columns) + "\n")
+    width = max(len("Criterion"), *(len(r["criterion"]) for r in results))
+    print(f"Rank  {'Criterion':<{width}}  Depth  Trees  F1 (mean ± std)    Accuracy (mean ± std)  Train s/fold")
+    for rank, r in enumerate(results, 1):
+        print(f"{rank:>4}  {r['criterion']:<{width}}  {r['max_depth']:>5}  {r['n_trees']:>5}  "
+              f"{r['f1_mean']:.4f} ± {r['f1_std']:.4f}    {r['accuracy_mean']:.4f} ± {r['accuracy_std']:.4f}       "
+              f"{r['train_seconds']:>10.4f}")
+    print(f"{len(configs)} configurations x {args.folds} folds in {elapsed:.2f}s")
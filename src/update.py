@@ -0,0 +1,180 @@
+import argparse
+import numpy as np
+import pandas as pd
+import dataset_cache
+from decision_tree import FeatureBins, FeatureSampler, Node, TrainingData, learn_node, parse_criterion, parse_max_features, resolve_max_features
+from forest import FlatForest, unflatten_forest
+from model_io import load_model
+from train import create_bootstrap_sample, load_dataset, write_subtrees_to_file
+
+
+def batch_weights(seed, n_seen, n_rows):
+    """
+    Weights of a batch of new rows in the tree of one seed (online bagging):
+    how often each row joins the tree's bootstrap sample is drawn from
+    Poisson(1), seeded by the seed and the number of rows seen before.
+    """
+    return np.random.RandomState([seed, n_seen]).poisson(1.0, n_rows).astype(np.int32)
+
+
+def history_weights(seed, batch_sizes):
+    """Weights of all rows seen so far: the original bootstrap sample, then every update batch."""
+    parts = [create_bootstrap_sample(batch_sizes[0], seed)]
+    n_seen = batch_sizes[0]
+    for n_rows in batch_sizes[1:]:
+        parts.append(batch_weights(seed, n_seen, n_rows))
+        n_seen += n_rows
+    return np.concatenate(parts)
+
+
+class ForestUpdater:
+    """
+    Folds a batch of new labelled rows into a trained forest. The new rows are
+    routed down every tree and the counts and votes along their paths are
+    updated. A node is re-learned only when the new rows make up at least
+    min_change of its (weighted) rows afterwards; then its subtree is grown
+    again from the history rows and new rows that reach it. history_files are
+    the training file and earlier batches, in order; only their row counts are
+    read up front, and they are loaded on the first re-learn. Updates that
+    re-learn nothing cost a pass over the new rows.
+    """
+    def __init__(self, history_files, new_df, max_depth, criterion, min_change=0.1, max_features=None, n_bins=None):
+        columns = pd.read_csv(history_files[0], sep="\t", nrows=0).columns
+        if list(new_df.columns) != list(columns):
+            raise ValueError("New rows must have the columns of the training data")
+        self.history_files = history_files
+        self.batch_sizes = [dataset_cache.count_rows(file_name) for file_name in history_files]
+        self.new = TrainingData(new_df)
+        self.max_depth = max_depth
+        self.criterion_func, self.optimize = criterion
+        self.min_change = min_change
+        self.k = resolve_max_features(max_features, len(self.new.features))
+        self.n_bins = n_bins
+        self.relearned = 0 # subtrees grown again
+        self._history = None
+        self._bins = None
+
+    def history(self):
+        if self._history is None:
+            self._history = TrainingData(pd.concat([load_dataset(file_name) for file_name in self.history_files],
+                                                   ignore_index=True))
+            if self.n_bins:
+                # Bins over every row, as train.py --bins computes them on the combined data
+                self._bins = FeatureBins(np.concatenate([self._history.X, self.new.X]), self.n_bins)
+        return self._history
+
+    def update_tree(self, tree, seed):
+        """Update one tree (trained with seed 42 + its index) in place and return it."""
+        self.seed = seed
+        self.new_weights = batch_weights(seed, sum(self.batch_sizes), len(self.new))
+        self.history_weights = None
+        self.history_reach = {} # node_id -> history rows reaching it, filled as re-learns need them
+        self.sampler = FeatureSampler(self.k, seed) if self.k < len(self.new.features) else None
+        self.update_node(tree, np.flatnonzero(self.new_weights), (), 1)
+        return tree
+
+    def update_node(self, node, rows, path, node_id):
+        labels = self.new.y[rows]
+        weights = self.new_weights[rows]
+        added = [int(weights[labels == 0].sum()), int(weights[labels == 1].sum())]
+        if sum(added) == 0:
+            return  # No new rows reach this subtree
+        if node.depth < self.max_depth and sum(added) >= self.min_change * (sum(node.counts) + sum(added)):
+            self.relearn(node, rows, path, node_id)
+            return
+        node.counts = [node.counts[0] + added[0], node.counts[1] + added[1]]
+        node.vote = node.get_vote()
+        if node.left is None or node.right is None:
+            return
+        # The split is recorded on the children (see learn_node)
+        attr, threshold = node.left.attr, node.left.threshold
+        goes_left = self.new.X[rows, self.new.feature_index[attr]] <= threshold
+        self.update_node(node.left, rows[goes_left], path + ((attr, threshold, True),), 2 * node_id)
+        self.update_node(node.right, rows[~goes_left], path + ((attr, threshold, False),), 2 * node_id + 1)
+
+    def reach(self, path, node_id):
+        """
+        History rows (with non-zero weight) that reach node node_id along path.
+        Each node's rows are filtered from its parent's and kept, so the history
+        is routed at most once per tree however many subtrees are re-learned.
+        Re-learned subtrees never contain another re-learned node, so the
+        splits along every path asked for are still the original ones.
+        """
+        if node_id not in self.history_reach:
+            if not path:
+                rows = np.flatnonzero(self.history_weights)
+            else:
+                attr, threshold, left = path[-1]
+                rows = self.reach(path[:-1], node_id // 2)
+                history = self.history()
+                goes_left = history.X[rows, history.feature_index[attr]] <= threshold
+                rows = rows[goes_left if left else ~goes_left]
+            self.history_reach[node_id] = rows
+        return self.history_reach[node_id]
+
+    def relearn(self, node, rows, path, node_id):
+        """Grow the subtree of node again from every row that reaches it."""
+        history = self.history()
+        if self.history_weights is None:
+            self.history_weights = history_weights(self.seed, self.batch_sizes)
+        reach = self.reach(path, node_id)
+        bins = None
+        if self._bins is not None:
+            # New row r is row len(history) + r of the binned matrix
+            codes = self._bins.codes[np.concatenate([reach, len(history) + rows])]
+            bins = FeatureBins.from_arrays(codes, self._bins.lower, self._bins.upper)
+        data = TrainingData.from_arrays(np.concatenate([history.X[reach], self.new.X[rows]]),
+                                        np.concatenate([history.y[reach], self.new.y[rows]]), history.columns, bins)
+        weights = np.concatenate([self.history_weights[reach], self.new_weights[rows]])
+        # learn_node builds the same tree as the level-wise builder, so the
+        # builder the forest was trained with does not matter here
+        fresh = Node(node.attr, node.threshold, node.depth, data, np.arange(len(weights)), weights,
+                     self.criterion_func, self.optimize, sampler=self.sampler, node_id=node_id)
+        fresh.chosen_attr.extend(attr for attr, _, _ in path)
+        learn_node(fresh, self.max_depth)
+        node.counts, node.vote, node.left, node.right = fresh.counts, fresh.vote, fresh.left, fresh.right
+        self.relearned += 1
+
+
+def update_forest(subtrees, history_files, new_df, max_depth, criterion, min_change=0.1, max_features=None,
+                  n_bins=None):
+    """
+    Update a forest (list of Node trees, tree i trained with seed 42 + i) with
+    a batch of new rows. Returns the updated trees and the ForestUpdater,
+    whose relearned attribute counts the subtrees that were grown again.
+    """
+    updater = ForestUpdater(history_files, new_df, max_depth, criterion, min_change, max_features, n_bins)
+    return [updater.update_tree(tree, 42 + i) for i, tree in enumerate(subtrees)], updater
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Update a trained forest with new labelled rows instead of retraining it"
+    )
+    parser.add_argument("model_input", type=str, help='Path to the trained forest (model file or pickle)')
+    parser.add_argument("new_input", type=str, help='Path to a TSV file of new rows (same columns as the training data)')
+    parser.add_argument("max_depth", type=int, help='Maximum depth the forest was trained with')
+    parser.add_argument("criterion", type=str,
+                        help='Splitting criterion the forest was trained with (mutual_information, gini, or lowest_variance)')
+    parser.add_argument("tree_text_out", type=str, help='Path to output text file for the updated forest')
+    parser.add_argument("tree_model_out", type=str,
+                        help='Path to output model file for the updated forest (a .pkl path writes a pickle)')
+    parser.add_argument("--history", nargs="+", required=True,
+                        help='The training TSV file followed by the batches of earlier updates, in order')
+    parser.add_argument("--min-change", type=float, default=0.1,
+                        help='Re-learn a subtree when the new rows are at least this fraction of its rows')
+    parser.add_argument("--max-features", type=str, default=None,
+                        help='Attributes considered per split, as used for training')
+    parser.add_argument("--bins", type=int, default=None,
+                        help='Histogram bins per feature, as used for training')
+    args = parser.parse_args()
+
+    forest = load_model(args.model_input)
+    subtrees = unflatten_forest(forest) if isinstance(forest, FlatForest) else forest
+    new_df = load_dataset(args.new_input)
+
+    subtrees, updater = update_forest(subtrees, args.history, new_df, args.max_depth, parse_criterion(args.criterion),
+                                      args.min_change, parse_max_features(args.max_features), args.bins)
+    write_subtrees_to_file(subtrees, args.tree_text_out, args.tree_model_out,
+                           updater.new.features, args.criterion.lower())
+    print(f"Added {len(new_df)} rows to {len(subtrees)} trees; re-learned {updater.relearned} subtrees")
@@ -0,0 +1,165 @@
+import argparse
+import os
+from html import escape
+from model_io import load_flat
+
+# Drawing units (pixels) shared by the SVG export and the GUI canvas
+X_SPACING = 150
+Y_SPACING = 90
+NODE_WIDTH = 136
+NODE_HEIGHT = 42
+MARGIN = 20
+
+
+def subtree_nodes(forest, i):
+    """Node indices of the subtree rooted at node i, in preorder."""
+    stack = [i]
+    while stack:
+        i = stack.pop()
+        yield i
+        if forest.feature[i] >= 0:
+            stack += [forest.right[i], forest.left[i]]
+
+
+def collapsed_below(forest, tree, depth):
+    """The internal nodes of a tree at the given depth: collapsing them shows depth levels."""
+    return frozenset(i for i in subtree_nodes(forest, forest.roots[tree])
+                     if forest.depth[i] == depth and forest.feature[i] >= 0)
+
+
+class TreeLayout:
+    """
+    Tidy layout of one tree of a FlatForest with some subtrees collapsed.
+    Visible leaves (real leaves and collapsed nodes) take consecutive columns
+    from left to right and every other node is centred over its two children,
+    so subtrees occupy disjoint column ranges and no two nodes overlap at any
+    depth. Built without recursion, so deep trees are fine.
+    """
+    def __init__(self, forest, tree, collapsed=frozenset()):
+        self.forest = forest
+        self.tree = tree
+        self.collapsed = frozenset(collapsed)
+        self.column = {} # visible node -> column (fractional for internal nodes)
+        self.edges = [] # (parent, child, branch label)
+        root = forest.roots[tree]
+        columns = 0
+        stack = [(root, False)]
+        while stack:
+            i, children_done = stack.pop()
+            if not self.is_open(i):
+                self.column[i] = columns
+                columns += 1
+            elif not children_done:
+                stack += [(i, True), (forest.right[i], False), (forest.left[i], False)]
+            else:
+                self.column[i] = (self.column[forest.left[i]] + self.column[forest.right[i]]) / 2
+                self.edges += [(i, forest.left[i], "<="), (i, forest.right[i], ">")]
+        self.columns = columns
+        self.levels = max(int(forest.depth[i]) for i in self.column) + 1
+
+    def is_open(self, i):
+        return self.forest.feature[i] >= 0 and i not in self.collapsed
+
+    def position(self, i):
+        """Centre of node i in drawing units."""
+        return (MARGIN + self.column[i] * X_SPACING + NODE_WIDTH / 2,
+                MARGIN + int(self.forest.depth[i]) * Y_SPACING + NODE_HEIGHT / 2)
+
+    def size(self):
+        return (2 * MARGIN + (self.columns - 1) * X_SPACING + NODE_WIDTH,
+                2 * MARGIN + (self.levels - 1) * Y_SPACING + NODE_HEIGHT)
+
+    def label(self, i):
+        """Two text lines for node i: its split (or vote) and its label counts."""
+        forest = self.forest
+        counts = "[%d 0/%d 1]" % tuple(forest.counts[i])
+        if forest.feature[i] < 0:
+            return f"vote {int(forest.vote[i])}", counts
+        if i in self.collapsed:
+            return f"+{sum(1 for _ in subtree_nodes(forest, i)) - 1} nodes", counts
+        return f"{forest.features[forest.feature[i]]} <= {forest.threshold[i]:.2f}", counts
+
+
+class LayoutCache:
+    """
+    Layouts of one forest, computed once per (tree, collapsed nodes) and then
+    reused; the oldest are dropped beyond max_size.
+    """
+    def __init__(self, forest, max_size=64):
+        self.forest = forest
+        self.max_size = max_size
+        self._layouts = {}
+
+    def layout(self, tree, collapsed=frozenset()):
+        key = (tree, frozenset(collapsed))
+        if key not in self._layouts:
+            if len(self._layouts) >= self.max_size:
+                del self._layouts[next(iter(self._layouts))]
+            self._layouts[key] = TreeLayout(self.forest, tree, key[1])
+        return self._layouts[key]
+
+
+def to_svg(layout):
+    width, height = layout.size()
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:g}" height="{height:g}" '
+             f'viewBox="0 0 {width:g} {height:g}" font-family="sans-serif" font-size="11">']
+    for parent, child, branch in layout.edges:
+        (x1, y1), (x2, y2) = layout.position(parent), layout.position(child)
+        y1 += NODE_HEIGHT / 2
+        y2 -= NODE_HEIGHT / 2
+        parts.append(f'<line x1="{x1:g}" y1="{y1:g}" x2="{x2:g}" y2="{y2:g}" stroke="#666"/>')
+        parts.append(f'<text x="{(x1 + x2) / 2:g}" y="{(y1 + y2) / 2:g}" text-anchor="middle" fill="#444">'
+                     f'{escape(branch)}</text>')
+    for i in layout.column:
+        x, y = layout.position(i)
+        fill = "#ddd" if i in layout.collapsed else "#cfe3f7" if layout.is_open(i) else "#d8f0d0"
+        parts.append(f'<rect x="{x - NODE_WIDTH / 2:g}" y="{y - NODE_HEIGHT / 2:g}" width="{NODE_WIDTH}" '
+                     f'height="{NODE_HEIGHT}" rx="6" fill="{fill}" stroke="#555"/>')
+        first, second = layout.label(i)
+        parts.append(f'<text x="{x:g}" y="{y - 3:g}" text-anchor="middle">{escape(first)}</text>')
+        parts.append(f'<text x="{x:g}" y="{y + 12:g}" text-anchor="middle">{escape(second)}</text>')
+    parts.append("</svg>")
+    return "\n".join(parts) + "\n"
+
+
+def to_dot(layout):
+    def quote(text):
+        return '"' + text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+
+    lines = [f"digraph tree_{layout.tree} {{", '  node [shape=box, style="rounded,filled", fontname="Helvetica"];']
+    for i in layout.column:
+        fill = "#dddddd" if i in layout.collapsed else "#cfe3f7" if layout.is_open(i) else "#d8f0d0"
+        lines.append(f'  n{i} [label={quote(chr(10).join(layout.label(i)))}, fillcolor="{fill}"];')
+    for parent, child, branch in layout.edges:
+        lines.append(f"  n{parent} -> n{child} [label={quote(branch)}];")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def write_layout(layout, file_name):
+    """Write a layout as DOT (.dot/.gv) or SVG (anything else)."""
+    with open(file_name, "w") as f:
+        f.write(to_dot(layout) if file_name.endswith((".dot", ".gv")) else to_svg(layout))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export trees of a forest as SVG or DOT, without a display")
+    parser.add_argument("model_input", type=str, help='Path to the forest (model file or legacy pickle)')
+    parser.add_argument("output", type=str,
+                        help='Output file (.svg, or .dot/.gv for Graphviz); with several trees, '
+                             '_tree<k> is added before the extension')
+    parser.add_argument("--tree", type=int, nargs="+", default=None, help='Trees to export (default: all)')
+    parser.add_argument("--max-depth", type=int, default=None,
+                        help='Collapse the subtrees below this depth (default: draw everything)')
+    args = parser.parse_args()
+
+    forest = load_flat(args.model_input)
+    cache = LayoutCache(forest)
+    trees = args.tree if args.tree is not None else range(forest.n_trees)
+    base, ext = os.path.splitext(args.output)
+    for tree in trees:
+        collapsed = collapsed_below(forest, tree, args.max_depth) if args.max_depth is not None else frozenset()
+        layout = cache.layout(tree, collapsed)
+        file_name = args.output if len(trees) == 1 else f"{base}_tree{tree}{ext}"
+        write_layout(layout, file_name)
+        print(f"{file_name}: {len(layout.column)} nodes shown, {layout.levels} levels")